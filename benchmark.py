@@ -0,0 +1,441 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+# Замер тракта захват -> превью -> запись/снимок без камер.
+# Запуск: python benchmark.py --cameras 2 --resolution 1920x1080 --fps 30 --duration 10
+# Время запуска: python benchmark.py --startup 5 --max-startup 1.5
+# Окно не показывается (платформа Qt offscreen), файлы пишутся во временную папку.
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QEventLoop, QTimer
+from PySide6.QtWidgets import QApplication
+
+
+class SyntheticCapture:
+    """Источник кадров с интерфейсом cv2.VideoCapture.
+
+    Отдаёт кадры заданного разрешения с заданной частотой, как камера:
+    read() ждёт следующего кадра, а при отставании читателя кадры теряются.
+    С CAP_PROP_FORMAT=-1 и FOURCC MJPG отдаёт сжатые кадры, как V4L2.
+    """
+    cameras = 2
+    size = (1920, 1080)
+    fps = 30.0
+    instances = []  # Все открытия устройств, для подсчёта пропущенных кадров
+
+    def __init__(self, index, *args):
+        self.index = index
+        self.width, self.height = self.size
+        self.fourcc = 0
+        self.raw = False
+        self.frame_no = 0
+        self.next_time = None
+        self.missed = 0  # Кадры, которые «камера» выдала, пока их никто не читал
+        self.base = None
+        self.encoded = None
+        SyntheticCapture.instances.append(self)
+
+    def isOpened(self):
+        return isinstance(self.index, int) and 0 <= self.index < self.cameras
+
+    def set(self, prop, value):
+        # Камера поддерживает не больше заданного разрешения, как реальная при запросе 4K
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = min(int(value), self.size[0])
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = min(int(value), self.size[1])
+        elif prop == cv2.CAP_PROP_FOURCC:
+            self.fourcc = int(value)
+        elif prop == cv2.CAP_PROP_FORMAT:
+            self.raw = value == -1 and self.fourcc == cv2.VideoWriter_fourcc(*'MJPG')
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def make_base(self):
+        x = np.linspace(0, 255, self.width, dtype=np.uint8)
+        y = np.linspace(0, 255, self.height, dtype=np.uint8)
+        self.base = np.dstack([np.tile(x, (self.height, 1)),
+                               np.tile(y[:, None], (1, self.width)),
+                               np.full((self.height, self.width), 40 * self.index, np.uint8)])
+        self.encoded = cv2.imencode(".jpg", self.base)[1].reshape(-1)
+
+    def wait_frame(self):
+        interval = 1.0 / self.fps
+        now = time.monotonic()
+        if self.next_time is None:
+            self.next_time = now
+        elif now > self.next_time + interval:
+            # Читатель отстал: пропущенные кадры камера уже выбросила
+            skipped = int((now - self.next_time) / interval)
+            self.missed += skipped
+            self.next_time += skipped * interval
+        delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time += interval
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        if self.base is None or self.base.shape[:2] != (self.height, self.width):
+            self.make_base()
+        self.wait_frame()
+        self.frame_no += 1
+        if self.raw:
+            return True, self.encoded.copy()
+        if image is None or image.shape != self.base.shape:
+            image = np.empty_like(self.base)
+        np.copyto(image, self.base)
+        # Движущаяся полоса, чтобы кадры различались
+        column = (self.frame_no * 8) % max(1, self.width - 16)
+        image[:, column:column + 16] = 255
+        return True, image
+
+    def release(self):
+        pass
+
+
+class StageTimes:
+    """Замеры по стадиям в миллисекундах"""
+    def __init__(self):
+        self.samples = {}
+        self.counters = {}
+
+    def add(self, stage, ms):
+        self.samples.setdefault(stage, []).append(ms)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def clear(self):
+        self.samples.clear()
+        self.counters.clear()
+
+    def summary(self):
+        result = {}
+        for stage, values in self.samples.items():
+            data = np.array(values)
+            result[stage] = {
+                "count": len(values),
+                "p50": round(float(np.percentile(data, 50)), 2),
+                "p95": round(float(np.percentile(data, 95)), 2),
+                "p99": round(float(np.percentile(data, 99)), 2),
+                "max": round(float(data.max()), 2),
+            }
+        return result
+
+
+def process_usage():
+    """(процессорное время в секундах, текущий RSS в МБ, пиковый RSS в МБ)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return time.process_time(), None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        pass
+    scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    return usage.ru_utime + usage.ru_stime, rss, usage.ru_maxrss / scale
+
+
+def spin(ms):
+    loop = QEventLoop()
+    QTimer.singleShot(int(ms), loop.quit)
+    loop.exec()
+
+
+def instrument(main, times):
+    """Оборачивает стадии тракта замерами; вызывается до создания страниц"""
+    page_class = main.ShootingControlPage
+    update_preview = page_class.update_preview
+
+    def timed_update_preview(self, cam_id, qt_image, seq):
+        worker = self.get_worker(cam_id)
+        stamp = worker.frames.timestamp(seq) if worker else None
+        if stamp is None:
+            times.count("preview_stale")
+        else:
+            times.add("capture_to_preview", (time.monotonic_ns() - stamp) / 1e6)
+        started = time.perf_counter()
+        update_preview(self, cam_id, qt_image, seq)
+        times.add("paint", (time.perf_counter() - started) * 1000)
+        times.count("previews")
+    page_class.update_preview = timed_update_preview
+
+    prepare_frame = main.VideoEncoderThread.prepare_frame
+
+    def timed_prepare_frame(self, seq):
+        stamp = self.frames.timestamp(seq)
+        started = time.perf_counter()
+        frame = prepare_frame(self, seq)
+        times.add("record_prepare", (time.perf_counter() - started) * 1000)
+        if stamp is not None:
+            times.add("capture_to_encoder", (time.monotonic_ns() - stamp) / 1e6)
+        return frame
+    main.VideoEncoderThread.prepare_frame = timed_prepare_frame
+
+    create_recorder = main.create_recorder
+
+    def timed_create_recorder(*args, **kwargs):
+        recorder = create_recorder(*args, **kwargs)
+        write = recorder.write
+
+        def timed_write(frame):
+            started = time.perf_counter()
+            write(frame)
+            times.add("encode", (time.perf_counter() - started) * 1000)
+        recorder.write = timed_write
+        return recorder
+    main.create_recorder = timed_create_recorder
+
+    photo_run = main.PhotoSaveTask.run
+
+    def timed_photo_run(self):
+        started = time.perf_counter()
+        photo_run(self)
+        times.add("imwrite", (time.perf_counter() - started) * 1000)
+    main.PhotoSaveTask.run = timed_photo_run
+
+
+def run_benchmark(args):
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    SyntheticCapture.cameras = args.cameras
+    SyntheticCapture.size = (width, height)
+    SyntheticCapture.fps = args.fps
+    cv2.VideoCapture = SyntheticCapture
+
+    os.environ["AMS_RECORDER"] = args.recorder
+    os.environ["AMS_MJPEG_CAPTURE"] = "1" if args.mjpeg else "0"
+    # Проверка сети не должна уходить наружу во время замера
+    os.environ.setdefault("AMS_UPLOAD_URL", "http://127.0.0.1:9")
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    workdir = args.output_dir or tempfile.mkdtemp(prefix="ams_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    import main
+    main.CameraRegistry.device_nodes = lambda self: [
+        (f"synthetic{i}", f"synthetic:{i}", i) for i in range(args.cameras)]
+    times = StageTimes()
+    instrument(main, times)
+
+    window = main.MainWindow()
+    deadline = time.monotonic() + 10
+    while not (window.ready and window.camera_registry.ready) and time.monotonic() < deadline:
+        spin(50)
+    window.state.camera_mode = args.mode
+    window.state.location_data = {'complex': 'bench', 'block': '1', 'tray': '1',
+                                  'side': 'A', 'direction': 'Вперед'}
+    window.navigate_to(main.ShootingControlPage)
+    page = window.stacked.currentWidget()
+    spin(args.warmup * 1000)
+
+    workers = {cam_id: page.get_worker(cam_id) for cam_id in page.camera_ids}
+    captured = {cam_id: 0 for cam_id in workers}
+
+    def count_frame(cam_id, seq):
+        captured[cam_id] += 1
+    for cam_id in workers:
+        window.camera_sessions.add_sink(cam_id, count_frame)
+    times.clear()
+    missed_start = sum(cap.missed for cap in SyntheticCapture.instances)
+    cpu_start, _, _ = process_usage()
+    started = time.monotonic()
+
+    encoders = {}
+    if args.mode == "video":
+        page.start_recording()
+        encoders = dict(page.encoders)
+        spin(args.duration * 1000)
+    else:
+        shots = 0
+        while time.monotonic() - started < args.duration:
+            shot = time.perf_counter()
+            page.capture_photos()
+            times.add("shutter", (time.perf_counter() - shot) * 1000)
+            shots += 1
+            spin(args.photo_interval * 1000)
+        times.count("photos", shots)
+
+    elapsed = time.monotonic() - started
+    cpu_end, rss, peak_rss = process_usage()
+    for cam_id in workers:
+        window.camera_sessions.remove_sink(cam_id, count_frame)
+    if args.mode == "video":
+        stop_started = time.perf_counter()
+        page.finish_recording()
+        times.add("finish_gui", (time.perf_counter() - stop_started) * 1000)
+        while any(encoder.isRunning() for encoder in encoders.values()):
+            spin(10)
+        times.add("record_close", (time.perf_counter() - stop_started) * 1000)
+    else:
+        page.return_to_main()
+    spin(200)
+    window.camera_sessions.stop_all()
+    window.reachability.stop()
+
+    cameras = {}
+    for cam_id, worker in workers.items():
+        info = {
+            "capture_fps": round(captured[cam_id] / elapsed, 2),
+            "frames": captured[cam_id],
+        }
+        if cam_id in encoders:
+            info.update(encoders[cam_id].stats())
+        cameras[cam_id] = info
+    return {
+        "config": {
+            "cameras": args.cameras, "resolution": args.resolution, "fps": args.fps,
+            "mode": args.mode, "recorder": args.recorder, "mjpeg": args.mjpeg,
+            "duration_s": round(elapsed, 2),
+        },
+        "cameras": cameras,
+        # Кадры, которые камера выдала, а поток захвата не успел прочитать
+        "source_missed_frames": sum(cap.missed for cap in SyntheticCapture.instances) - missed_start,
+        "stages_ms": times.summary(),
+        "counters": times.counters,
+        "cpu_percent": round(100 * (cpu_end - cpu_start) / elapsed, 1),
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "output_dir": workdir,
+    }, window
+
+
+def print_report(result):
+    config = result["config"]
+    print(f"Режим {config['mode']}, камер {config['cameras']}, {config['resolution']} @ {config['fps']} к/с, "
+          f"запись {config['recorder']}{' (MJPEG)' if config['mjpeg'] else ''}, {config['duration_s']} с")
+    for cam_id, info in result["cameras"].items():
+        extra = ""
+        if "written" in info:
+            extra = f", записано {info['written']}, потеряно {info['dropped']}"
+        print(f"  Камера {cam_id}: {info['capture_fps']} к/с{extra}")
+    print(f"  {'стадия':<22}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  мс")
+    for stage, stats in result["stages_ms"].items():
+        print(f"  {stage:<22}{stats['count']:>7}{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}{stats['max']:>9}")
+    if result["counters"]:
+        print("  " + ", ".join(f"{name}: {value}" for name, value in result["counters"].items()))
+    print(f"  Пропущено кадров источника: {result['source_missed_frames']}")
+    print(f"  CPU {result['cpu_percent']}%, RSS {result['rss_mb']} МБ (пик {result['peak_rss_mb']} МБ)")
+
+
+# Запускается в отдельном процессе: печатает момент, когда главный экран показан
+STARTUP_PROBE = """
+import os, sys
+from PySide6.QtCore import QObject, QEvent
+from PySide6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+sys.path.insert(0, {root!r})
+import main
+
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            # ready=1: службы создались раньше первой отрисовки и задержали её
+            print("ready", int(window.ready), flush=True)
+            os._exit(0)
+        return False
+
+
+window = main.MainWindow()
+probe = FirstPaint()
+window.pages[main.MainPage].installEventFilter(probe)
+app.exec()
+"""
+
+
+def run_startup_benchmark(args):
+    """Время от запуска интерпретатора до главного экрана, по args.startup запускам"""
+    import statistics
+    import subprocess
+    env = dict(os.environ, AMS_UPLOAD_URL=os.environ.get("AMS_UPLOAD_URL", "http://127.0.0.1:9"))
+    workdir = args.output_dir or tempfile.mkdtemp(prefix="ams_startup_")
+    os.makedirs(workdir, exist_ok=True)
+    code = STARTUP_PROBE.format(root=os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+    blocked = 0  # Запуски, где службы MainWindow создались до первой отрисовки
+    for _ in range(args.startup):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - started
+        process.wait()
+        if not line.startswith("ready"):
+            raise RuntimeError("Приложение не показало главный экран")
+        samples.append(elapsed * 1000)
+        blocked += line.split()[1:] == ["1"]
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples), 1),
+        "median_ms": round(statistics.median(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "services_before_paint": blocked,
+        "limit_ms": args.max_startup * 1000 if args.max_startup else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замер тракта кадров на синтетических камерах")
+    parser.add_argument("--cameras", type=int, default=2)
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=1.0, help="прогрев до замера, с")
+    parser.add_argument("--mode", choices=("video", "photo"), default="video")
+    parser.add_argument("--recorder", default="xvid", help="ключ RECORDER_BACKENDS")
+    parser.add_argument("--mjpeg", action="store_true", help="сжатые кадры с камеры (AMS_MJPEG_CAPTURE)")
+    parser.add_argument("--photo-interval", type=float, default=1.0, help="пауза между снимками, с")
+    parser.add_argument("--output-dir", help="папка для файлов записи (по умолчанию временная)")
+    parser.add_argument("--json", help="сохранить результат в файл JSON")
+    parser.add_argument("--startup", type=int, default=0, metavar="N",
+                        help="вместо тракта кадров замерить запуск до главного экрана N раз")
+    parser.add_argument("--max-startup", type=float, help="порог медианы запуска, с; при превышении код 1")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.startup:
+        result = run_startup_benchmark(args)
+        print(f"Запуск до главного экрана, {result['runs']} раз: медиана {result['median_ms']} мс "
+              f"(мин {result['min_ms']}, макс {result['max_ms']})")
+        if result["services_before_paint"]:
+            print(f"  Службы создавались до первой отрисовки в {result['services_before_paint']} запусках")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        if result["limit_ms"] and result["median_ms"] > result["limit_ms"]:
+            print(f"  Превышен порог {args.max_startup} с")
+            sys.exit(1)
+        sys.exit(0)
+    result, window = run_benchmark(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    # Окно удаляется до завершения интерпретатора, иначе PySide может упасть при сборке мусора
+    window.deleteLater()
+    spin(100)
+    QApplication.instance().shutdown()
@@ -5,26 +5,21 @@ from PySide6.QtGui import QImage, QPixmap
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, 
                               QVBoxLayout, QHBoxLayout, QLabel,
                               QTabWidget, QTextEdit, QComboBox)
+from main import probe_cameras
 
-def list_ports():
+def list_ports(max_port=10):
     non_working_ports = []
-    dev_port = 0
     working_ports = []
     available_ports = []
-    while len(non_working_ports) < 6:
-        camera = cv2.VideoCapture(dev_port)
-        if not camera.isOpened():
+    results = probe_cameras(range(max_port), read_frame=True)
+    for dev_port in range(max_port):
+        info = results.get(dev_port)
+        if info is None:
             non_working_ports.append(dev_port)
+        elif info['readable']:
+            working_ports.append((dev_port, info['height'], info['width']))
         else:
-            is_reading, img = camera.read()
-            w = camera.get(3)
-            h = camera.get(4)
-            if is_reading:
-                working_ports.append((dev_port, h, w))
-            else:
-                available_ports.append(dev_port)
-        dev_port +=1
-        camera.release()
+            available_ports.append(dev_port)
     return available_ports, working_ports, non_working_ports
 
 class CameraWorker(QObject):
@@ -1,18 +1,59 @@
 from datetime import datetime
 import sys
 import os
-import requests
-from PySide6.QtWidgets import *
-from PySide6.QtCore import Qt, QTimer, Signal, QObject, QDateTime, QThread, QMutex
+import importlib
+from PySide6.QtWidgets import (QApplication, QMainWindow, QStackedWidget, QWidget, QVBoxLayout,
+                               QHBoxLayout, QGridLayout, QFormLayout, QGroupBox, QLabel, QPushButton,
+                               QLineEdit, QComboBox, QMessageBox, QProgressDialog, QSizePolicy,
+                               QSpacerItem)
+from PySide6.QtCore import Qt, QTimer, Signal, QObject, QDateTime, QThread, QMutex, QMutexLocker, QFileSystemWatcher
 from PySide6.QtGui import QFont
-import cv2
 import platform
 import subprocess
 from PySide6.QtGui import QImage, QPixmap
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                            QPushButton, QGridLayout, QMessageBox)
 import json
-import numpy as np
+import glob
+import hashlib
+import shutil
+import socket
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к атрибуту"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        value = getattr(self.load(), attr)
+        setattr(self, attr, value)
+        return value
+
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+requests = LazyModule("requests")
+
+
+def warm_up():
+    """Фоновая загрузка тяжёлых модулей, пока пользователь смотрит на главный экран"""
+    for module in (np, cv2, requests):
+        try:
+            module.load()
+        except ImportError as e:
+            print(f"Не удалось загрузить {module._name}: {e}")
+    importlib.import_module("requests.adapters")
+
 
 class AppState:
     """Глобальное состояние приложения"""
@@ -23,36 +64,174 @@ class AppState:
         self.connection_status = False
         self.flight_number = 1
         self.start_point = ""
+        self.upload_url = os.environ.get("AMS_UPLOAD_URL", "")
+        # Способ записи видео (ключ RECORDER_BACKENDS) и параметры ffmpeg для киоска
+        self.recorder_backend = os.environ.get("AMS_RECORDER", "xvid")
+        if self.recorder_backend not in RECORDER_BACKENDS:
+            print(f"Неизвестный AMS_RECORDER={self.recorder_backend}, используется xvid")
+            self.recorder_backend = "xvid"
+        # Захват сжатых кадров MJPEG без декодирования (вместе с AMS_RECORDER=mjpeg)
+        self.mjpeg_capture = os.environ.get("AMS_MJPEG_CAPTURE") == "1"
+        # Поток GoPro; для проверки без камеры — other/udp_replay.py на localhost
+        self.gopro_stream_url = os.environ.get("AMS_GOPRO_STREAM", "udp://@10.5.5.100:8554")
+        # Метрики тракта кадров: наложение на превью и файл JSON lines для сравнения киосков
+        self.metrics_overlay = os.environ.get("AMS_METRICS_OVERLAY") == "1"
+        self.metrics_file = os.environ.get("AMS_METRICS_FILE", "")
+        self.metrics_interval = float(os.environ.get("AMS_METRICS_INTERVAL", "10"))
+        # Запас места на диске: минимальная длительность записи, неприкосновенный остаток,
+        # удаление уже выгруженных сессий при нехватке места
+        self.min_record_minutes = float(os.environ.get("AMS_MIN_RECORD_MINUTES", "10"))
+        self.min_free_mb = int(os.environ.get("AMS_MIN_FREE_MB", "1024"))
+        self.storage_rotate = os.environ.get("AMS_STORAGE_ROTATE") == "1"
+        # Снимки: выравнивать кадры камер по общему моменту и допустимый рассинхрон
+        self.sync_capture = os.environ.get("AMS_SYNC_CAPTURE", "1") == "1"
+        self.sync_tolerance_ms = float(os.environ.get("AMS_SYNC_TOLERANCE_MS", "40"))
+        # Запись сегментами (0 - без ограничения) и выгрузка готовых сегментов во время съёмки
+        self.segment_seconds = int(os.environ.get("AMS_SEGMENT_SECONDS", "300"))
+        self.segment_mb = int(os.environ.get("AMS_SEGMENT_MB", "0"))
+        self.upload_while_recording = os.environ.get("AMS_UPLOAD_WHILE_RECORDING", "1") == "1"
+        self.recorder_options = {}
+        if self.recorder_backend in ("h264", "h265"):
+            self.recorder_options = {
+                "preset": os.environ.get("AMS_FFMPEG_PRESET", "veryfast"),
+                "crf": int(os.environ.get("AMS_FFMPEG_CRF", "23")),
+            }
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.state = AppState()
+        self.ready = False  # Службы созданы (init_services)
+        self.background_uploader = None
+        self.finishing_threads = set()
+        QApplication.instance().aboutToQuit.connect(self.wait_finishing_threads)
+        # Сначала главный экран: он отрисуется при первом проходе цикла событий,
+        # а службы и остальные страницы создаются сразу после этого
+        self.pages = {}  # Класс страницы -> экземпляр, для страниц с cached = True
         self.stacked = QStackedWidget()
         self.setCentralWidget(self.stacked)
-        self.init_pages()
+        main_page = MainPage(self)
+        main_page.set_ready(False)
+        self.pages[MainPage] = main_page
+        self.stacked.addWidget(main_page)
         self.showFullScreen()
+        threading.Thread(target=warm_up, daemon=True).start()
+        # Таймер с нулевой задержкой срабатывает раньше первой отрисовки, поэтому
+        # службы создаются после неё; запасной таймер - если окно не отрисуется
+        main_page.painted.connect(lambda: QTimer.singleShot(0, self.init_services),
+                                  Qt.ConnectionType.SingleShotConnection)
+        QTimer.singleShot(1000, self.init_services)
+
+    def init_services(self):
+        if self.ready:
+            return
+        self.camera_registry = CameraRegistry(self)
+        self.camera_registry.refresh()
+        self.gopro_manager = GoProManager(self)
+        QApplication.instance().aboutToQuit.connect(self.gopro_manager.close)
+        self.camera_sessions = CameraSessionManager(self.state, self)
+        QApplication.instance().aboutToQuit.connect(self.camera_sessions.stop_all)
+        self.metrics_logger = None
+        if self.state.metrics_file:
+            self.metrics_logger = MetricsLogger(self.state.metrics_file, self.state.metrics_interval, parent=self)
+            QApplication.instance().aboutToQuit.connect(self.metrics_logger.stop)
+        self.manifest = SessionManifest()
+        self.storage = StorageManager(self.manifest, min_free=self.state.min_free_mb * 2 ** 20,
+                                      rotate=self.state.storage_rotate)
+        self.reachability = ReachabilityMonitor(self.state.upload_url or "https://www.google.com")
+        self.reachability.status_changed.connect(
+            lambda connected: setattr(self.state, 'connection_status', connected))
+        self.reachability.start()
+        QApplication.instance().aboutToQuit.connect(self.reachability.stop)
+        QApplication.instance().aboutToQuit.connect(self.close_background_upload)
+        self.init_pages()
+        self.ready = True
+        self.pages[MainPage].set_ready(True)
 
     def init_pages(self):
-        self.stacked.addWidget(MainPage(self))
-        self.stacked.addWidget(UploadPage(self))
+        for page_class in (UploadPage,):
+            page = page_class(self)
+            self.pages[page_class] = page
+            self.stacked.addWidget(page)
+
+    def keep_until_finished(self, thread):
+        """Хранит ссылку на поток до его завершения, даже если страница уже удалена"""
+        self.finishing_threads.add(thread)
+        thread.finished.connect(self.on_thread_finished)
+
+    def on_thread_finished(self):
+        self.finishing_threads.discard(self.sender())
+
+    def wait_finishing_threads(self):
+        for thread in list(self.finishing_threads):
+            thread.wait()
+
+    def start_background_upload(self):
+        """Выгружает готовые файлы в фоне, не прерывая съёмку"""
+        if not (self.state.upload_url and self.state.upload_while_recording and self.state.connection_status):
+            return
+        if self.background_uploader and self.background_uploader.isRunning():
+            # Новые сегменты уйдут со следующим запуском
+            return
+        self.background_uploader = SessionUploader(self.state.upload_url, self.manifest, streams=1)
+        self.background_uploader.start()
+
+    def stop_background_upload(self, then=None):
+        """Прерывает фоновую выгрузку, не блокируя интерфейс; then вызывается после её остановки"""
+        uploader, self.background_uploader = self.background_uploader, None
+        if uploader is None or not uploader.isRunning():
+            if then:
+                then()
+            return
+        uploader.cancel()
+        if then:
+            uploader.finished.connect(then, Qt.ConnectionType.SingleShotConnection)
+
+    def close_background_upload(self):
+        """При выходе: прерывает выгрузку и ждёт её не дольше нескольких секунд"""
+        if self.background_uploader:
+            self.background_uploader.cancel()
+            self.background_uploader.wait(5000)
 
     def navigate_to(self, page_class, destroy_current=True):
-        if destroy_current and self.stacked.count() > 1:
-            old_page = self.stacked.widget(1)
+        old_page = self.stacked.currentWidget()
+        if hasattr(old_page, 'deactivate'):
+            old_page.deactivate()
+        if not getattr(page_class, 'uses_cameras', False):
+            # Обследование закончено: камеры больше не нужны
+            self.camera_sessions.stop_all()
+
+        new_page = self.pages.get(page_class)
+        if new_page is None:
+            new_page = page_class(self)
+            self.stacked.addWidget(new_page)
+            if getattr(page_class, 'cached', False):
+                self.pages[page_class] = new_page
+        elif hasattr(new_page, 'activate'):
+            new_page.activate()
+        self.stacked.setCurrentWidget(new_page)
+
+        # Кэшированные страницы не удаляются, остальные создаются заново при каждом переходе
+        if destroy_current and old_page is not new_page and old_page not in self.pages.values():
             self.stacked.removeWidget(old_page)
             old_page.deleteLater()
-        
-        new_page = page_class(self)
-        self.stacked.addWidget(new_page)
-        self.stacked.setCurrentWidget(new_page)
 
 class MainPage(QWidget):
+    cached = True
+    painted = Signal()  # Первая отрисовка главного экрана
+
     def __init__(self, parent):
         super().__init__(parent)
         self.window = parent
+        self.first_paint = True
         self.init_ui()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint:
+            self.first_paint = False
+            self.painted.emit()
+
     def init_ui(self):
         layout = QVBoxLayout(self)
         layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -85,14 +264,417 @@ class MainPage(QWidget):
         layout.addWidget(self.btn_scan)
         layout.addWidget(self.btn_power)
 
+    def set_ready(self, ready):
+        """Переходы доступны, когда MainWindow создал службы"""
+        self.btn_upload.setEnabled(ready)
+        self.btn_scan.setEnabled(ready)
+
+class ReachabilityMonitor(QThread):
+    """Фоновая проверка доступности сервера выгрузки с растущим интервалом"""
+    status_changed = Signal(bool)
+
+    def __init__(self, url, interval=10.0, retry_interval=2.0, max_interval=60.0, timeout=1.5):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.connected = False
+        self.checked_at = None  # time.monotonic() последней проверки
+        self.running = True
+        self.wake = threading.Event()
+
+    def probe(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout):
+                return True
+        except OSError:
+            return False
+
+    def check_now(self):
+        """Внеочередная проверка, если последний результат старше retry_interval"""
+        if self.checked_at is None or time.monotonic() - self.checked_at > self.retry_interval:
+            self.wake.set()
+
+    def run(self):
+        backoff = self.retry_interval
+        first = True
+        while self.running:
+            connected = self.probe()
+            self.checked_at = time.monotonic()
+            if first or connected != self.connected:
+                self.connected = connected
+                self.status_changed.emit(connected)
+            first = False
+            if connected:
+                backoff = self.retry_interval
+                delay = self.interval
+            else:
+                delay = backoff
+                backoff = min(backoff * 2, self.max_interval)
+            self.wake.wait(delay)
+            self.wake.clear()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.wait()
+
+
+SESSION_LOG_NAME = "session.jsonl"
+
+
+class SessionMetadataLog:
+    """Журнал описаний файлов одной сессии (session.jsonl) с отложенным сбросом на диск"""
+    def __init__(self, folder, flush_interval=2.0):
+        self.path = os.path.join(folder, SESSION_LOG_NAME)
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.flushed_at = time.monotonic()
+
+    def append(self, metadata):
+        line = json.dumps(metadata, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                # Снимки, сохранённые после close(), дописываются в тот же журнал
+                self.file = open(self.path, "a", encoding="utf-8", buffering=64 * 1024)
+            self.file.write(line)
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.file.flush()
+                self.flushed_at = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                self.flushed_at = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+
+def is_session_metadata(name):
+    """Файл описаний в папке сессии: журнал или старый session_*.json"""
+    return name == SESSION_LOG_NAME or (name.startswith("session_") and name.endswith(".json"))
+
+
+def load_session_metadata(folder):
+    """Описания файлов сессии в схеме сервера: {имя медиафайла: metadata}"""
+    records = []
+    for sidecar in sorted(glob.glob(os.path.join(folder, "session_*.json"))):
+        try:
+            with open(sidecar) as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    try:
+        with open(os.path.join(folder, SESSION_LOG_NAME), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return {os.path.basename(metadata.get("fileURL", "")): metadata
+            for metadata in records if isinstance(metadata, dict) and metadata.get("fileURL")}
+
+
+def collect_session_files(roots=("photo", "video")):
+    """Находит медиафайлы сессий вместе с их описаниями из журнала сессии"""
+    items = []
+    for root in roots:
+        for folder in sorted(glob.glob(os.path.join(root, "session_*"))):
+            if not os.path.isdir(folder):
+                continue
+            for name, metadata in load_session_metadata(folder).items():
+                media = os.path.join(folder, name)
+                if not os.path.isfile(media):
+                    continue
+                items.append({
+                    'key': os.path.normpath(media),
+                    'media': media,
+                    'metadata': metadata,
+                    'size': os.path.getsize(media),
+                })
+    return items
+
+
+def file_checksum(path, block_size=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SessionManifest:
+    """Журнал файлов сессий и состояния их выгрузки в SQLite"""
+    def __init__(self, path="manifest.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    session TEXT NOT NULL,
+                    point TEXT,
+                    camera INTEGER,
+                    file_type TEXT,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    checksum TEXT,
+                    metadata TEXT NOT NULL,
+                    upload_state TEXT NOT NULL DEFAULT 'pending',
+                    upload_id TEXT,
+                    upload_offset INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_state ON files (upload_state, created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_session ON files (session)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            interrupted = [row[0] for row in self.conn.execute(
+                "SELECT path FROM files WHERE upload_state = 'recording'")]
+        # Записи, прерванные падением или отключением питания, выгружаются как есть
+        for path in interrupted:
+            self.finish_file(path)
+
+    def add_file(self, path, metadata, camera=None, size=0, checksum=None, upload_state='pending'):
+        """Добавляет файл (или обновляет запись о нём); состояние 'recording' - файл ещё пишется"""
+        path = os.path.normpath(path)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO files (path, session, point, camera, file_type, size, checksum,
+                                   metadata, upload_state, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    size = excluded.size, checksum = excluded.checksum, metadata = excluded.metadata,
+                    upload_state = excluded.upload_state, updated_at = excluded.updated_at""",
+                (path, os.path.basename(os.path.dirname(path)),
+                 None if metadata.get("gardenBedPoint") is None else str(metadata["gardenBedPoint"]),
+                 camera, metadata.get("fileType"), size, checksum, json.dumps(metadata),
+                 upload_state, now, now))
+
+    def finish_file(self, path):
+        """Отмечает, что запись файла завершена и его можно выгружать"""
+        path = os.path.normpath(path)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET size = ?, upload_state = 'pending', updated_at = ? WHERE path = ?",
+                (size, time.time(), path))
+
+    def set_checksum(self, path, checksum):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE files SET checksum = ? WHERE path = ?", (checksum, path))
+
+    def update_upload(self, path, upload_id, offset, done=False):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET upload_id = ?, upload_offset = ?, upload_state = ?, updated_at = ? WHERE path = ?",
+                (upload_id, offset, 'uploaded' if done else 'pending', time.time(), path))
+
+    def uploaded(self):
+        """Выгруженные файлы, ещё лежащие на диске, от старых к новым: [(путь, размер)]"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size FROM files WHERE upload_state = 'uploaded' ORDER BY created_at").fetchall()
+        return [(row['path'], row['size']) for row in rows]
+
+    def mark_removed(self, path):
+        """Файл выгружен и удалён с диска для освобождения места"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET upload_state = 'removed', updated_at = ? WHERE path = ?", (time.time(), path))
+
+    def mark_missing(self, path):
+        """Файл пропал с диска до выгрузки: больше не ставится в очередь"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE files SET upload_state = 'missing', updated_at = ? WHERE path = ?", (time.time(), path))
+
+    def pending(self):
+        """Файлы, ожидающие выгрузки, в порядке съёмки"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM files WHERE upload_state = 'pending' ORDER BY created_at").fetchall()
+        return [{
+            'key': row['path'],
+            'media': row['path'],
+            'metadata': json.loads(row['metadata']),
+            'size': row['size'],
+            'checksum': row['checksum'],
+            'upload_id': row['upload_id'],
+            'offset': row['upload_offset'],
+        } for row in rows]
+
+    def import_legacy(self, collect):
+        """Однократно переносит в журнал сессии, снятые до его появления"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+        if row is not None:
+            return
+        for item in collect():
+            with self.lock:
+                known = self.conn.execute(
+                    "SELECT 1 FROM files WHERE path = ?", (item['key'],)).fetchone()
+            if not known:
+                self.add_file(item['media'], item['metadata'], size=item['size'])
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('legacy_imported', '1')")
+
+
+class SessionUploader(QThread):
+    """Выгрузка медиафайлов сессий на сервер с докачкой (протокол - в other/upload_server.py)"""
+    progress = Signal(object, object)  # отправлено байт, всего байт
+    file_finished = Signal(str, bool)
+    upload_finished = Signal(int, int)  # выгружено, не удалось
+
+    def __init__(self, url, manifest, streams=3,
+                 chunk_size=8 * 1024 * 1024, retries=5, timeout=30):
+        super().__init__()
+        self.url = url.rstrip("/")
+        self.manifest = manifest
+        self.items = []
+        self.streams = streams
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.cancelled = False
+        self.cancel_event = threading.Event()  # Прерывает паузу между повторами
+        self.lock = threading.Lock()
+        self.total = 0
+        self.sent = 0
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=streams)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def save_entry(self, key, entry):
+        self.manifest.update_upload(key, entry.get('id'), entry.get('offset', 0), entry.get('done', False))
+
+    def add_sent(self, count):
+        with self.lock:
+            self.sent += count
+            sent = self.sent
+        self.progress.emit(sent, self.total)
+
+    def cancel(self):
+        self.cancelled = True
+        self.cancel_event.set()
+
+    def upload_file(self, item):
+        key = item['key']
+        size = item['size']
+        entry = {'id': item['upload_id'], 'offset': item['offset'], 'size': size} if item['upload_id'] else {}
+        if not os.path.isfile(item['media']):
+            # Иначе файл навсегда остался бы первым в очереди
+            self.manifest.mark_missing(key)
+            return False
+
+        acked = 0  # Байты этого файла, уже учтённые в прогрессе
+        attempt = 0
+        while not self.cancelled:
+            try:
+                if item['checksum'] is None:
+                    item['checksum'] = file_checksum(item['media'])
+                    self.manifest.set_checksum(key, item['checksum'])
+                if entry.get('size') != size or 'id' not in entry:
+                    response = self.session.post(f"{self.url}/uploads", json={
+                        "fileName": os.path.basename(item['media']),
+                        "size": size,
+                        "checksum": item['checksum'],
+                        "metadata": item['metadata'],
+                    }, timeout=self.timeout)
+                    response.raise_for_status()
+                    data = response.json()
+                    entry = {'id': data['id'], 'offset': int(data.get('offset', 0)), 'size': size}
+                else:
+                    response = self.session.head(f"{self.url}/uploads/{entry['id']}", timeout=self.timeout)
+                    if response.status_code == 404:
+                        entry = {}
+                        continue
+                    response.raise_for_status()
+                    entry['offset'] = int(response.headers.get("Upload-Offset", 0))
+                self.save_entry(key, entry)
+                self.add_sent(entry['offset'] - acked)
+                acked = entry['offset']
+
+                with open(item['media'], 'rb') as f:
+                    while entry['offset'] < size and not self.cancelled:
+                        f.seek(entry['offset'])
+                        chunk = f.read(self.chunk_size)
+                        end = entry['offset'] + len(chunk) - 1
+                        response = self.session.post(
+                            f"{self.url}/uploads/{entry['id']}",
+                            files={"chunk": (os.path.basename(item['media']), chunk, "application/octet-stream")},
+                            headers={"Content-Range": f"bytes {entry['offset']}-{end}/{size}"},
+                            timeout=self.timeout)
+                        response.raise_for_status()
+                        entry['offset'] = int(response.json()['offset'])
+                        self.save_entry(key, entry)
+                        self.add_sent(entry['offset'] - acked)
+                        acked = entry['offset']
+                        attempt = 0
+
+                if entry['offset'] >= size:
+                    entry['done'] = True
+                    self.save_entry(key, entry)
+                    return True
+            except (requests.RequestException, OSError, ValueError, KeyError):
+                attempt += 1
+                if attempt > self.retries:
+                    return False
+                # После разрыва смещение будет запрошено у сервера заново
+                self.cancel_event.wait(min(2 ** attempt, 30))
+        return False
+
+    def run(self):
+        uploaded = failed = 0
+        self.manifest.import_legacy(collect_session_files)
+        self.items = self.manifest.pending()
+        self.total = sum(item['size'] for item in self.items)
+        self.progress.emit(0, self.total)
+        with ThreadPoolExecutor(max_workers=self.streams) as executor:
+            futures = {executor.submit(self.upload_file, item): item for item in self.items}
+            for future in as_completed(futures):
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"Ошибка выгрузки {futures[future]['media']}: {e}")
+                    ok = False
+                uploaded += ok
+                failed += not ok
+                self.file_finished.emit(futures[future]['media'], ok)
+        self.session.close()
+        self.upload_finished.emit(uploaded, failed)
+
+
 class UploadPage(QWidget):
+    cached = True
+
     def __init__(self, parent):
         super().__init__(parent)
         self.window = parent
-        self.timer = QTimer(self)
         self.init_ui()
-        self.timer.timeout.connect(self.check_connection)
-        self.timer.start(2000)
+        monitor = self.window.reachability
+        monitor.status_changed.connect(self.update_ui)
+        if monitor.checked_at is not None:
+            self.update_ui(monitor.connected)
+        monitor.check_now()
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -141,15 +723,9 @@ class UploadPage(QWidget):
         layout.addStretch()
         layout.addLayout(btn_layout)
     
-    def check_connection(self):
-        try:
-            requests.get("https://www.google.com", timeout=3)
-            self.window.state.connection_status = True
-            self.update_ui(True)
-        except:
-            self.window.state.connection_status = False
-            self.update_ui(False)
-    
+    def activate(self):
+        self.window.reachability.check_now()
+
     def update_ui(self, connected):
         if connected:
             self.status_label.setText("Доступность сети Wi-Fi: ✓ Подключено")
@@ -161,21 +737,42 @@ class UploadPage(QWidget):
             self.upload_btn.setEnabled(False)
     
     def start_upload(self):
-        progress = QProgressDialog("Выгрузка данных...", "Отмена", 0, 100, self)
-        progress.setWindowModality(Qt.WindowModality.WindowModal)
-        for i in range(101):
-            progress.setValue(i)
-            QApplication.processEvents()
-            if progress.wasCanceled():
-                break
-        progress.close()
-        QMessageBox.information(self, "Статус", 
-            "Данные успешно выгружены!" if progress.value() == 100 else "Выгрузка прервана")
+        if not self.window.state.upload_url:
+            QMessageBox.warning(self, "Ошибка", "Не задан адрес сервера выгрузки (AMS_UPLOAD_URL)")
+            return
+        self.upload_btn.setEnabled(False)
+        # Фоновая выгрузка сегментов не должна передавать те же файлы параллельно
+        self.window.stop_background_upload(then=self.begin_upload)
+
+    def begin_upload(self):
+        self.uploader = SessionUploader(self.window.state.upload_url, self.window.manifest)
+        self.progress = QProgressDialog("Выгрузка данных...", "Отмена", 0, 1000, self)
+        self.progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress.setAutoClose(False)
+        self.progress.canceled.connect(self.uploader.cancel)
+        self.uploader.progress.connect(
+            lambda sent, total: self.progress.setValue(int(1000 * sent / total) if total else 1000))
+        self.uploader.upload_finished.connect(self.on_upload_finished)
+        self.uploader.start()
+
+    def on_upload_finished(self, uploaded, failed):
+        cancelled = self.uploader.cancelled
+        self.progress.close()
+        self.upload_btn.setEnabled(self.window.state.connection_status)
+        if cancelled:
+            QMessageBox.information(self, "Статус", "Выгрузка прервана")
+        elif failed:
+            QMessageBox.warning(self, "Статус",
+                f"Выгружено файлов: {uploaded}, не удалось: {failed}.\nОни будут дозагружены при следующей выгрузке.")
+        else:
+            QMessageBox.information(self, "Статус", "Данные успешно выгружены!")
     
     def go_back(self):
         self.window.navigate_to(MainPage)
 
 class SelectModePage(QWidget):
+    cached = True
+
     def __init__(self, parent):
         super().__init__(parent)
         self.window = parent
@@ -302,35 +899,312 @@ class LocationPage(QWidget):
         self.window.navigate_to(SelectModePage)
 
 
+def usb_identity(node):
+    """USB-идентификатор устройства video4linux (vendor:product:serial) или None"""
+    usb_dir = os.path.realpath(os.path.join("/sys/class/video4linux", os.path.basename(node), "device", ".."))
+    parts = []
+    for name in ("idVendor", "idProduct", "serial"):
+        try:
+            with open(os.path.join(usb_dir, name)) as f:
+                parts.append(f.read().strip())
+        except OSError:
+            parts.append("")
+    return ":".join(parts) if any(parts) else None
+
+
+def probe_camera(index, read_frame=False):
+    """Открывает камеру index и возвращает её параметры (None, если не открылась)"""
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            return None
+        info = {
+            'type': 'webcam',
+            'index': index,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+        if read_frame:
+            info['readable'] = cap.read()[0]
+        return info
+    finally:
+        cap.release()
+
+
+def probe_cameras(indices, timeout=3.0, read_frame=False, on_late=None):
+    """Опрашивает камеры параллельно; не уложившиеся в timeout передаются в on_late(index, info)"""
+    results = {}
+    lock = threading.Lock()
+    expired = []
+
+    def probe(index):
+        try:
+            info = probe_camera(index, read_frame)
+        except Exception:
+            info = None
+        with lock:
+            if not expired:
+                results[index] = info
+                return
+        if on_late:
+            on_late(index, info)
+
+    threads = [threading.Thread(target=probe, args=(i,), daemon=True) for i in indices]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    with lock:
+        expired.append(True)
+        return dict(results)
+
+
+class CameraRegistry(QObject):
+    """Реестр камер: фоновый опрос и кэш по узлу устройства"""
+    cameras_changed = Signal()
+
+    def __init__(self, parent=None, max_index=4, probe_timeout=3.0):
+        super().__init__(parent)
+        self.max_index = max_index
+        self.probe_timeout = probe_timeout
+        self.cache = {}  # (узел, USB-идентификатор) -> параметры камеры или None
+        self.late_probes = {}  # Индекс -> ключ кэша для опросов, не уложившихся в таймаут
+        self.ready = False
+        self.scanning = False
+        self.rescan_requested = False
+        self.mutex = QMutex()
+        self.hotplug_timer = QTimer(self)
+        self.hotplug_timer.setSingleShot(True)
+        self.hotplug_timer.setInterval(500)  # Сглаживает серию событий при подключении
+        self.hotplug_timer.timeout.connect(self.refresh)
+        self.watcher = None
+        if os.path.isdir("/dev"):
+            self.watcher = QFileSystemWatcher(["/dev"], self)
+            self.watcher.directoryChanged.connect(lambda path: self.hotplug_timer.start())
+
+    def device_nodes(self):
+        """Текущие устройства: [(узел, USB-идентификатор, индекс OpenCV)]"""
+        nodes = []
+        paths = glob.glob("/dev/video*")
+        if paths:
+            for path in paths:
+                suffix = path[len("/dev/video"):]
+                if suffix.isdigit():
+                    nodes.append((path, usb_identity(path), int(suffix)))
+        elif platform.system() != 'Linux':
+            # Без /dev/video* (Windows) ключом служит индекс устройства
+            nodes = [(f"index:{i}", None, i) for i in range(self.max_index)]
+        return sorted(nodes, key=lambda node: node[2])
+
+    def cameras(self):
+        """Доступные камеры из кэша, по возрастанию индекса"""
+        with QMutexLocker(self.mutex):
+            found = [info for info in self.cache.values() if info is not None]
+        return sorted(found, key=lambda info: info['index'])
+
+    def camera_indices(self):
+        return [info['index'] for info in self.cameras()]
+
+    def refresh(self):
+        """Запускает фоновое обновление; повторный вызов во время опроса откладывается"""
+        with QMutexLocker(self.mutex):
+            if self.scanning:
+                self.rescan_requested = True
+                return
+            self.scanning = True
+        threading.Thread(target=self.scan, daemon=True).start()
+
+    def scan(self):
+        changed = False
+        first_scan = not self.ready
+        while True:
+            nodes = self.device_nodes()
+            keys = {(node, usb_id): index for node, usb_id, index in nodes}
+            with QMutexLocker(self.mutex):
+                stale = [key for key in self.cache if key not in keys]
+                # Медленная камера ещё открывается прежним опросом: второй не запускается
+                new = {key: index for key, index in keys.items()
+                       if key not in self.cache and self.late_probes.get(index) != key}
+            results = probe_cameras(sorted(new.values()), self.probe_timeout, on_late=self.on_late_probe)
+            with QMutexLocker(self.mutex):
+                changed |= bool(stale) or any(results.get(index) is not None for index in new.values())
+                for key in stale:
+                    del self.cache[key]
+                for key, index in new.items():
+                    if index not in results:
+                        # Не уложился в таймаут: результат придёт в on_late_probe
+                        self.late_probes[index] = key
+                        continue
+                    info = results[index]
+                    if info is not None:
+                        info['node'], info['usb_id'] = key
+                    self.cache[key] = info
+                self.ready = True
+                if not self.rescan_requested:
+                    self.scanning = False
+                    break
+                self.rescan_requested = False
+        if changed or first_scan:
+            self.cameras_changed.emit()
+
+    def on_late_probe(self, index, info):
+        """Результат медленного опроса; вызывается из его потока"""
+        present = {(node, usb_id) for node, usb_id, _ in self.device_nodes()}
+        with QMutexLocker(self.mutex):
+            key = self.late_probes.get(index)
+            if key is None:
+                return
+            if key not in present:
+                # Пока опрос шёл, камеру отключили
+                del self.late_probes[index]
+                return
+            if info is not None:
+                info['node'], info['usb_id'] = key
+            self.cache[key] = info
+            del self.late_probes[index]
+        if info is not None:
+            self.cameras_changed.emit()
+
+
+GOPRO_USB_VENDOR = "2672"  # idVendor GoPro в /sys/bus/usb/devices
+GOPRO_MDNS_SERVICE = "_gopro-web._tcp.local."
+
+
+def gopro_usb_devices(root="/sys/bus/usb/devices"):
+    """GoPro, подключённые по USB: [{'path', 'product', 'serial'}] из sysfs"""
+    devices = []
+    for vendor_path in glob.glob(os.path.join(root, "*", "idVendor")):
+        try:
+            with open(vendor_path) as f:
+                if f.read().strip() != GOPRO_USB_VENDOR:
+                    continue
+        except OSError:
+            continue
+        device = {'path': os.path.dirname(vendor_path)}
+        for name in ("idProduct", "product", "serial"):
+            try:
+                with open(os.path.join(device['path'], name)) as f:
+                    device[name] = f.read().strip()
+            except OSError:
+                device[name] = ""
+        devices.append(device)
+    return devices
+
+
 class GoProManager(QObject):
+    """Обнаружение GoPro по USB и mDNS без запуска внешних программ"""
     status_changed = Signal(str)
+    devices_changed = Signal()
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, parent=None, mdns=True):
+        super().__init__(parent)
         self.connected = False
-
-    def detect(self):
+        self.usb_devices = []
+        self.network_devices = {}  # имя сервиса mDNS -> адрес
+        self.mutex = QMutex()
+        self.hotplug_timer = QTimer(self)
+        self.hotplug_timer.setSingleShot(True)
+        self.hotplug_timer.setInterval(500)
+        self.hotplug_timer.timeout.connect(self.refresh)
+        self.watcher = None
+        if os.path.isdir("/dev/bus/usb"):
+            self.watcher = QFileSystemWatcher(self)
+            self.watch_usb()
+            self.watcher.directoryChanged.connect(lambda path: self.hotplug_timer.start())
+        self.zeroconf = None
+        if mdns:
+            self.start_mdns()
+        self.refresh()
+
+    def watch_usb(self):
+        # Узлы устройств лежат в /dev/bus/usb/<шина>: следим и за шинами
+        paths = ["/dev/bus/usb"] + glob.glob("/dev/bus/usb/*")
+        missing = [path for path in paths if path not in self.watcher.directories()]
+        if missing:
+            self.watcher.addPaths(missing)
+
+    def start_mdns(self):
         try:
-            if platform.system() == 'Windows':
-                output = subprocess.check_output("pnputil /enum-devices /class Camera", shell=True)
-                return b'GoPro' in output
+            from zeroconf import Zeroconf, ServiceBrowser
+        except ImportError:
+            return
+        try:
+            self.zeroconf = Zeroconf()
+            self.browser = ServiceBrowser(self.zeroconf, GOPRO_MDNS_SERVICE, handlers=[self.on_mdns_service])
+        except OSError as e:
+            print(f"mDNS недоступен: {e}")
+            self.zeroconf = None
+
+    def on_mdns_service(self, zeroconf, service_type, name, state_change):
+        # Вызывается из потока zeroconf
+        address = None
+        if state_change.name != "Removed":
+            info = zeroconf.get_service_info(service_type, name, timeout=1000)
+            if info and info.parsed_addresses():
+                address = info.parsed_addresses()[0]
+        with QMutexLocker(self.mutex):
+            if address:
+                self.network_devices[name] = address
             else:
-                output = subprocess.check_output("lsusb").decode()
-                return 'GoPro' in output
-        except:
-            return False
+                self.network_devices.pop(name, None)
+        self.update_connected()
+
+    def refresh(self):
+        if platform.system() == 'Windows':
+            # pnputil медленный: опрос в фоне, результат придёт через devices_changed
+            threading.Thread(target=self.scan_windows, daemon=True).start()
+            return
+        if self.watcher:
+            self.watch_usb()
+        devices = gopro_usb_devices()
+        with QMutexLocker(self.mutex):
+            self.usb_devices = devices
+        self.update_connected()
+
+    def scan_windows(self):
+        try:
+            output = subprocess.check_output(["pnputil", "/enum-devices", "/class", "Camera"])
+            devices = [{'path': 'pnputil', 'product': 'GoPro', 'serial': ''}] if b'GoPro' in output else []
+        except (OSError, subprocess.CalledProcessError):
+            devices = []
+        with QMutexLocker(self.mutex):
+            self.usb_devices = devices
+        self.update_connected()
+
+    def update_connected(self):
+        with QMutexLocker(self.mutex):
+            connected = bool(self.usb_devices or self.network_devices)
+            changed = connected != self.connected
+            self.connected = connected
+        if changed:
+            self.status_changed.emit("GoPro подключена" if connected else "GoPro отключена")
+            self.devices_changed.emit()
+
+    def detect(self):
+        return self.connected
+
+    def close(self):
+        if self.zeroconf:
+            self.zeroconf.close()
+            self.zeroconf = None
 
 class CameraDetectionPage(QWidget):
+    cached = True
+    uses_cameras = True
+
     def __init__(self, parent):
         super().__init__(parent)
         self.window = parent
         self.cameras = []
         self.current_cam = 0
-        self.cap = None
-        self.timer = QTimer(self)
-        self.gopro_manager = GoProManager()
+        self.subscription = None  # Подписка на превью текущей камеры в CameraSessionManager
+        self.active = True
+        self.gopro_manager = self.window.gopro_manager
         self.init_ui()
         self.find_cameras()
+        self.window.camera_registry.cameras_changed.connect(self.find_cameras)
+        self.gopro_manager.devices_changed.connect(self.find_cameras)
 
     def init_ui(self):
         main_layout = QVBoxLayout(self)
@@ -340,7 +1214,7 @@ class CameraDetectionPage(QWidget):
         title.setStyleSheet("font-size: 24px; font-weight: bold;")
         main_layout.addWidget(title)
 
-        self.video_label = QLabel()
+        self.video_label = PreviewLabel()
         self.video_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.video_label.setMinimumSize(640, 480)
         self.video_label.setStyleSheet("background-color: black;")
@@ -366,7 +1240,7 @@ class CameraDetectionPage(QWidget):
 
         bottom_layout = QHBoxLayout()
         back_btn = QPushButton("< Назад")
-        back_btn.clicked.connect(lambda: self.window.navigate_to(MainPage))
+        back_btn.clicked.connect(self.go_back)
         self.status_label = QLabel("Камеры проверены, далее =>")
         next_btn = QPushButton(self.status_label.text())
         next_btn.clicked.connect(self.next_step)
@@ -377,18 +1251,10 @@ class CameraDetectionPage(QWidget):
         main_layout.addLayout(bottom_layout)
 
     def find_cameras(self):
-        self.cameras = []
-        for i in range(4):
-            try:
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    self.cameras.append({'type': 'webcam', 'index': i})
-                    cap.release()
-            except:
-                pass
+        self.cameras = [{'type': 'webcam', 'index': i} for i in self.window.camera_registry.camera_indices()]
 
         if self.gopro_manager.detect():
-            self.cameras.append({'type': 'gopro', 'index': 0})
+            self.cameras.append({'type': 'gopro', 'index': GOPRO_CAMERA_ID})
         self.update_ui()
 
     def update_ui(self):
@@ -398,33 +1264,36 @@ class CameraDetectionPage(QWidget):
 
         self.prev_btn.setEnabled(self.current_cam > 0)
         self.next_btn.setEnabled(self.current_cam < len(self.cameras)-1)
-        self.start_camera()
+        if self.active:
+            self.start_camera()
 
     def start_camera(self):
-        if self.cap:
-            self.cap.release()
+        self.detach_camera()
         if not self.cameras:
             return
 
+        self.current_cam = min(self.current_cam, len(self.cameras) - 1)
         current = self.cameras[self.current_cam]
-        if current['type'] == 'webcam':
-            try:
-                self.cap = cv2.VideoCapture(current['index'])
-                self.timer.timeout.connect(self.update_frame)
-                self.timer.start(30)
-            except:
-                QMessageBox.critical(self, "Ошибка", "Не удалось запустить камеру")
-        elif current['type'] == 'gopro':
-            self.video_label.setText("Режим GoPro")
-
-    def update_frame(self):
-        if self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = frame.shape
-                q_img = QImage(frame.data, w, h, ch * w, QImage.Format.Format_RGB888)
-                self.video_label.setPixmap(QPixmap.fromImage(q_img))
+        # Камера открывается один раз и остаётся открытой до конца обследования
+        sessions = self.window.camera_sessions
+        self.subscription = sessions.subscribe(
+            current['index'], self.update_frame, (self.video_label.width(), self.video_label.height()))
+        self.video_label.size_changed.connect(self.subscription.set_size)
+        if sessions.worker(current['index']).measured_fps == 0:
+            self.video_label.setText("Подключение к GoPro..." if current['type'] == 'gopro' else "Подключение к камере...")
+
+    def detach_camera(self):
+        """Отключает превью от потока камеры, сам поток продолжает работать"""
+        if self.subscription:
+            CameraSessionManager.disconnect_slot(self.video_label.size_changed, self.subscription.set_size)
+            self.window.camera_sessions.unsubscribe(self.subscription)
+            self.subscription = None
+
+    def update_frame(self, cam_id, q_img, seq):
+        if self.subscription and cam_id == self.subscription.camera_id:
+            started = time.perf_counter_ns()
+            self.video_label.setPixmap(QPixmap.fromImage(q_img))
+            metrics.record(cam_id, "paint", (time.perf_counter_ns() - started) / 1e6)
 
     def prev_camera(self):
         if self.current_cam > 0:
@@ -436,17 +1305,29 @@ class CameraDetectionPage(QWidget):
             self.current_cam += 1
             self.update_ui()
 
+    def go_back(self):
+        self.window.navigate_to(MainPage)
+
     def next_step(self):
         if self.cameras:
             self.window.navigate_to(ShootingSetupPage)
 
+    def activate(self):
+        """Страница снова показана из кэша MainWindow"""
+        self.active = True
+        self.find_cameras()
+
+    def deactivate(self):
+        self.active = False
+        self.detach_camera()
+
     def closeEvent(self, event):
-        if self.cap:
-            self.cap.release()
-        self.timer.stop()
+        self.detach_camera()
 
 
 class ShootingSetupPage(QWidget):
+    uses_cameras = True
+
     def __init__(self, parent):
         super().__init__(parent)
         self.window = parent
@@ -545,15 +1426,117 @@ class ShootingSetupPage(QWidget):
         self.window.state.flight_number = self.number_input.text()
 
 
-from PySide6.QtWidgets import *
-from PySide6.QtCore import Qt, QThread, QMutex, QMutexLocker, Signal
+from PySide6.QtCore import Qt, QThread, QMutex, QMutexLocker, Signal, QRunnable, QThreadPool
 from PySide6.QtGui import QImage, QPixmap
-import cv2
 import os
-import numpy as np
+import queue
+import time
 from datetime import datetime
 
+# Профили записи: название и максимальная высота кадра (None - разрешение камеры)
+RECORD_PROFILES = {
+    "native": ("Исходное разрешение", None),
+    "1080p": ("1080p", 1080),
+    "720p": ("720p", 720),
+}
+
+
+def record_size(capture_size, profile):
+    """Размер кадра в файле для профиля записи; пропорции кадра сохраняются"""
+    width, height = capture_size
+    max_height = RECORD_PROFILES[profile][1]
+    if max_height is None or height <= max_height:
+        return width, height
+    # Кодеки требуют чётных размеров
+    return int(width * max_height / height) // 2 * 2, max_height
+
+
+# Оценка объёма записи: бит на пиксель кадра для каждого способа записи
+RECORD_BITS_PER_PIXEL = {
+    "xvid": 0.15,
+    "mjpeg": 1.2,
+    "h264": 0.07,
+    "h265": 0.04,
+}
+PHOTO_BITS_PER_PIXEL = 2.0  # JPEG с качеством OpenCV по умолчанию
+
+
+class StorageManager:
+    """Учёт места на диске под съёмку и освобождение его от выгруженных файлов"""
+    def __init__(self, manifest, root=".", min_free=1024 * 2 ** 20, rotate=False):
+        self.manifest = manifest
+        self.root = root
+        self.min_free = min_free  # Остаток, который не занимается никогда
+        self.rotate_uploaded = rotate
+        self.reservations = {}  # ключ (папка сессии) -> байт
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.root).free
+
+    def available(self, exclude=None):
+        """Свободное место за вычетом остатка и чужих резервов"""
+        reserved = sum(size for key, size in self.reservations.items() if key != exclude)
+        return self.free_bytes() - self.min_free - reserved
+
+    @staticmethod
+    def estimate_rate(backend, streams):
+        """Поток записи в байт/с; streams - [((ширина, высота), fps)] по камерам"""
+        bits = RECORD_BITS_PER_PIXEL.get(backend, RECORD_BITS_PER_PIXEL["xvid"])
+        return sum(width * height * fps * bits / 8 for (width, height), fps in streams)
+
+    @staticmethod
+    def estimate_photo(sizes):
+        """Объём одного снимка со всех камер; sizes - [(ширина, высота)]"""
+        return sum(width * height * PHOTO_BITS_PER_PIXEL / 8 for width, height in sizes)
+
+    def seconds_left(self, rate, key=None):
+        if rate <= 0:
+            return float("inf")
+        return max(0.0, self.available(exclude=key)) / rate
+
+    def ensure_available(self, size, key=None):
+        """Есть ли size байт; при нехватке пробует освободить место"""
+        missing = size - self.available(exclude=key)
+        if missing <= 0:
+            return True
+        if self.rotate_uploaded:
+            self.rotate(missing)
+        return self.available(exclude=key) >= size
+
+    def reserve(self, key, size):
+        self.reservations[key] = size
+
+    def release(self, key):
+        self.reservations.pop(key, None)
+
+    def rotate(self, size):
+        """Удаляет самые старые выгруженные файлы, пока не освободится size байт"""
+        freed = 0
+        for path, _ in self.manifest.uploaded():
+            if freed >= size:
+                break
+            try:
+                file_size = os.path.getsize(path)
+                os.remove(path)
+                freed += file_size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Не удалось удалить {path}: {e}")
+                continue
+            self.manifest.mark_removed(path)
+            folder = os.path.dirname(path)
+            # Папка сессии без снимков и видео удаляется вместе с описаниями
+            if os.path.isdir(folder) and all(is_session_metadata(name) for name in os.listdir(folder)):
+                shutil.rmtree(folder, ignore_errors=True)
+        if freed:
+            print(f"Освобождено {freed / 2 ** 20:.0f} МБ удалением выгруженных сессий")
+        return freed
+
+
 class ShootingControlPage(QWidget):
+    uses_cameras = True
+
     def __init__(self, parent):
         super().__init__(parent)
         self.stop_count = 0
@@ -562,16 +1545,45 @@ class ShootingControlPage(QWidget):
         self.window = parent
         self.camera_mode = self.window.state.camera_mode
         self.camera_ids = []
-        self.workers = []
-        self.video_writers = {}
+        self.subscriptions = {}  # cam_id -> FrameSubscription превью
+        self.encoders = {}
+        self.closing_encoders = set()  # Остановлены, но ещё дописывают файлы
+        self.recording_metadata = {}
+        self.metadata_log = None  # SessionMetadataLog текущей папки сессии
+        self.encoder_queue_size = 8
+        self.encoder_policy = "drop"  # "drop" или "block" при переполнении очереди
+        self.record_profile = "native"  # Ключ RECORD_PROFILES
+        self.preview_containers = {}
         self.preview_labels = {}
         self.is_recording = False
         self.preview_mutex = QMutex()  # Мьютекс для синхронизации превью
         self.selected_point = self.window.state.flight_number
         self.count_try = 1
+        self.save_pool = QThreadPool(self)
+        self.pending_saves = 0
+        self.shot_note = ""
+        self.sync_capture = self.window.state.sync_capture
+        self.sync_tolerance_ms = self.window.state.sync_tolerance_ms
+        self.metrics_labels = {}
+        self.show_metrics = self.window.state.metrics_overlay
+        self.record_rate = 0.0  # Оценка потока записи, байт/с
+        self.storage_warned = False
+        self.storage_timer = QTimer(self)
+        self.storage_timer.timeout.connect(self.check_storage)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics_overlay)
+        # Журнал описаний сбрасывается на диск и без новых снимков
+        self.metadata_timer = QTimer(self)
+        self.metadata_timer.timeout.connect(lambda: self.metadata_log and self.metadata_log.flush())
+        self.metadata_timer.start(2000)
         self.create_session_folder(self.selected_point)
         self.init_ui()
-        self.init_cameras()
+        if self.window.camera_registry.ready:
+            self.init_cameras()
+        else:
+            # Первый опрос камер ещё идёт: превью появятся по его завершении
+            self.window.camera_registry.cameras_changed.connect(
+                self.init_cameras, Qt.ConnectionType.SingleShotConnection)
         
     def init_ui(self):
         main_layout = QVBoxLayout(self)
@@ -603,9 +1615,12 @@ class ShootingControlPage(QWidget):
 
             self.count_try_label_1 = QLabel("Остановок на пролёте")
             self.count_try_label_2 = QLabel(f"{self.count_try}")
+            self.save_status_label = QLabel("")
 
             params_layout_count.addWidget(self.count_try_label_1)
             params_layout_count.addWidget(self.count_try_label_2)
+            params_layout_count.addStretch()
+            params_layout_count.addWidget(self.save_status_label)
 
             main_layout.addLayout(params_layout_count)
 
@@ -659,6 +1674,13 @@ class ShootingControlPage(QWidget):
             self.pause_btn.clicked.connect(self.toggle_pause)
             self.finish_btn.clicked.connect(self.finish_recording)
             
+            self.profile_combo = QComboBox()
+            for key, (title, height) in RECORD_PROFILES.items():
+                self.profile_combo.addItem(title, key)
+            self.profile_combo.currentIndexChanged.connect(
+                lambda: setattr(self, 'record_profile', self.profile_combo.currentData()))
+
+            mode_btn_layout.addWidget(self.profile_combo)
             mode_btn_layout.addWidget(self.record_btn)
             mode_btn_layout.addWidget(self.pause_btn)
             mode_btn_layout.addWidget(self.finish_btn)
@@ -679,7 +1701,13 @@ class ShootingControlPage(QWidget):
             mode_btn_layout.addWidget(self.shoot_btn)
             mode_btn_layout.addWidget(self.finish_btn)
 
+        self.metrics_btn = QPushButton("Метрики")
+        self.metrics_btn.setCheckable(True)
+        self.metrics_btn.setChecked(self.show_metrics)
+        self.metrics_btn.toggled.connect(self.set_metrics_visible)
+
         control_layout.addWidget(back_btn)
+        control_layout.addWidget(self.metrics_btn)
         control_layout.addStretch()
         control_layout.addLayout(mode_btn_layout)
         main_layout.addLayout(control_layout)
@@ -689,6 +1717,9 @@ class ShootingControlPage(QWidget):
         folder_name = "video" if self.camera_mode == "video" else "photo"
         self.session_folder = os.path.join(folder_name, f"session_{timestamp}" if self.camera_mode == "video" else f"session_{timestamp}_point_{point}")
         os.makedirs(self.session_folder, exist_ok=True)
+        if self.metadata_log is not None:
+            self.metadata_log.close()
+        self.metadata_log = SessionMetadataLog(self.session_folder)
         return timestamp
 
     def init_cameras(self):
@@ -700,130 +1731,351 @@ class ShootingControlPage(QWidget):
             container = QGroupBox(f"Камера {cam_id}")
             layout = QVBoxLayout()
             
-            preview_label = QLabel()
+            preview_label = PreviewLabel()
             preview_label.setMinimumSize(320, 240)
             preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
             preview_label.setStyleSheet("background: #222;")
             
             layout.addWidget(preview_label)
+            metrics_label = QLabel()
+            metrics_label.setStyleSheet("font: 11px monospace; color: #2c3e50;")
+            metrics_label.setVisible(self.show_metrics)
+            layout.addWidget(metrics_label)
+            self.metrics_labels[cam_id] = metrics_label
             container.setLayout(layout)
             self.preview_grid.addWidget(container, i//2, i%2)
+            self.preview_containers[cam_id] = container
             with QMutexLocker(self.preview_mutex):
                 self.preview_labels[cam_id] = preview_label
             
             # Запуск потока захвата кадров
             self.start_camera_stream(cam_id)
+        self.save_pool.setMaxThreadCount(max(1, len(self.camera_ids)))
+        self.set_metrics_visible(self.show_metrics)
     
     def detect_available_cameras(self, max_check=4):
-        available = []
-        for i in range(max_check):
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                available.append(i)
-                cap.release()
-            else:
-                cap.release()
-                break
-        return available
+        indices = self.window.camera_registry.camera_indices()[:max_check]
+        if self.window.gopro_manager.detect():
+            indices.append(GOPRO_CAMERA_ID)
+        return indices
+
+    def recording_rate(self, profile):
+        streams = []
+        for cam_id in self.camera_ids:
+            worker = self.get_worker(cam_id)
+            if worker:
+                streams.append((record_size(worker.capture_size(), profile), worker.capture_fps()))
+        return StorageManager.estimate_rate(self.window.state.recorder_backend, streams)
+
+    def plan_storage(self):
+        """Проверяет место под минимальную длительность записи, при нехватке уменьшает профиль"""
+        storage = self.window.storage
+        seconds = self.window.state.min_record_minutes * 60
+        profiles = list(RECORD_PROFILES)
+        for profile in profiles[profiles.index(self.record_profile):]:
+            rate = self.recording_rate(profile)
+            if storage.ensure_available(rate * seconds):
+                if profile != self.record_profile:
+                    QMessageBox.warning(self, "Мало места",
+                        f"Места на диске не хватит на {self.window.state.min_record_minutes:.0f} мин записи "
+                        f"в профиле «{RECORD_PROFILES[self.record_profile][0]}».\n"
+                        f"Запись пойдёт в профиле «{RECORD_PROFILES[profile][0]}».")
+                    self.profile_combo.setCurrentIndex(profiles.index(profile))
+                    self.record_profile = profile
+                self.record_rate = rate
+                return True
+        free_gb = storage.free_bytes() / 2 ** 30
+        QMessageBox.critical(self, "Нет места",
+            f"Свободно {free_gb:.1f} ГБ: этого не хватит на {self.window.state.min_record_minutes:.0f} мин записи.\n"
+            "Выгрузите данные на сервер и освободите место.")
+        return False
+
+    def check_storage(self):
+        """Следит за местом во время записи: предупреждает и останавливает запись до заполнения диска"""
+        if not self.is_recording:
+            return
+        measured = sum(encoder.recorder.stats().get("bitrate_kbps", 0) for encoder in self.encoders.values())
+        rate = max(self.record_rate, measured * 1000 / 8)
+        left = self.window.storage.seconds_left(rate, key=self.session_folder)
+        if left < 30:
+            self.stop_recording()
+            QMessageBox.critical(self, "Нет места", "Запись остановлена: на диске заканчивается место.")
+        elif left < 300 and not self.storage_warned:
+            self.storage_warned = True
+            QMessageBox.warning(self, "Мало места", f"Места на диске осталось примерно на {left / 60:.0f} мин записи.")
 
     def start_recording(self):
+        if not self.plan_storage():
+            return
         time_start = self.create_session_folder()
+        self.window.storage.reserve(self.session_folder, self.record_rate * self.window.state.min_record_minutes * 60)
+        self.storage_warned = False
+        self.storage_timer.start(5000)
         self.is_recording = True
         self.recording_paused = False
         self.record_btn.setEnabled(False)
+        self.profile_combo.setEnabled(False)
         self.pause_btn.setEnabled(True)
         self.finish_btn.setEnabled(True)
         
+        state = self.window.state
+        self.recording_metadata = {
+            "greenHouse": state.location_data['complex'],
+            "block": state.location_data['block'],
+            "gardenBed": state.location_data['tray'],
+            "gardenBedSide": state.location_data['side'],
+            "fileType": "video",
+            "task": "crowns",
+            "createDate": time_start
+        }
+        segmented = bool(state.segment_seconds or state.segment_mb)
         for cam_id in self.camera_ids:
-            filename = os.path.join(self.session_folder, f"camera_{cam_id}.avi")
-            self.video_writers[cam_id] = cv2.VideoWriter(
-                filename, cv2.VideoWriter_fourcc(*'XVID'), 30.0, (1920, 1080))
-            with open(os.path.join(self.session_folder, f"session_{cam_id}.json"), 'w') as f:
-                json.dump({
-                    "greenHouse": self.window.state.location_data['complex'],
-                    "block": self.window.state.location_data['block'],
-                    "gardenBed": self.window.state.location_data['tray'],
-                    "gardenBedSide": self.window.state.location_data['side'],
-                    "fileURL": filename,
-                    "fileType": "video",
-                    "task": "crowns",
-                    "createDate": time_start
-                }, f)
+            worker = self.get_worker(cam_id)
+            if not worker:
+                continue
+            size = record_size(worker.capture_size(), self.record_profile)
+            path_base = os.path.join(self.session_folder, f"camera_{cam_id}")
+
+            def recorder_factory(index, path_base=path_base, fps=worker.capture_fps(), size=size):
+                name = f"{path_base}_{index:03d}" if segmented else path_base
+                return create_recorder(state.recorder_backend, name, fps, size, **state.recorder_options)
+
+            recorder = recorder_factory(0)
+            self.register_segment(cam_id, recorder.filename, 0)
+            # Очередь длиннее кольцевого буфера бесполезна: старые слоты будут перезаписаны
+            max_queue = min(self.encoder_queue_size, worker.frames.slots - 1)
+            encoder = VideoEncoderThread(
+                cam_id, worker.frames, recorder, size, max_queue, self.encoder_policy,
+                recorder_factory=recorder_factory if segmented else None,
+                segment_seconds=state.segment_seconds, segment_bytes=state.segment_mb * 2 ** 20,
+                on_segment_started=self.register_segment,
+                on_segment_finished=lambda cam_id, filename: self.window.manifest.finish_file(filename),
+                source_size=worker.capture_size())
+            encoder.stats_updated.connect(self.update_encoder_stats)
+            encoder.segment_finished.connect(self.on_segment_finished)
+            encoder.failed.connect(self.on_encoder_failed)
+            encoder.start()
+            self.window.camera_sessions.add_sink(cam_id, encoder.submit)
+            self.encoders[cam_id] = encoder
+
+    def register_segment(self, cam_id, filename, index):
+        """Описание и запись в журналы для нового файла записи; вызывается и из потока кодирования"""
+        metadata = dict(self.recording_metadata, fileURL=filename, segment=index)
+        self.metadata_log.append(metadata)
+        # Файл попадёт в очередь выгрузки, когда сегмент будет закрыт
+        self.window.manifest.add_file(filename, metadata, cam_id, upload_state='recording')
+
+    def on_encoder_failed(self, cam_id, error):
+        """Кодировщик камеры остановился: запись прекращается, следующая пойдёт в XVID"""
+        if not self.is_recording:
+            return
+        self.stop_recording()
+        state = self.window.state
+        fallback = ""
+        if state.recorder_backend != "xvid":
+            state.recorder_backend = "xvid"
+            state.recorder_options = {}
+            fallback = "\nСледующая запись пойдёт в XVID."
+        QMessageBox.critical(self, "Ошибка записи", f"Камера {cam_id}: {error}\nЗапись остановлена.{fallback}")
+
+    def on_segment_finished(self, cam_id, filename):
+        if self.is_recording:
+            self.window.start_background_upload()
 
     def toggle_pause(self):
         self.recording_paused = not self.recording_paused
+        for encoder in self.encoders.values():
+            encoder.paused = self.recording_paused
         self.pause_btn.setText("Продолжить" if self.recording_paused else "Пауза")
 
     def start_camera_stream(self, cam_id):
-        worker = CameraWorker(cam_id)
-        worker.frame_ready.connect(self.update_preview)
-        worker.start()
-        self.workers.append(worker)
+        # Поток камеры обычно уже запущен страницей обнаружения
+        preview_label = self.preview_labels[cam_id]
+        size = (preview_label.width(), preview_label.height()) if preview_label.isVisible() else (320, 240)
+        subscription = self.window.camera_sessions.subscribe(cam_id, self.update_preview, size)
+        preview_label.size_changed.connect(subscription.set_size)
+        self.subscriptions[cam_id] = subscription
     
-    def update_preview(self, cam_id, qt_image, original_frame):
+    def update_preview(self, cam_id, qt_image, seq):
         locker = QMutexLocker(self.preview_mutex)  # Блокировка мьютекса
         
         if cam_id in self.preview_labels:
             preview_label = self.preview_labels[cam_id]
             # Проверка на существование виджета
             if preview_label and preview_label.parent() is not None:
-                preview_label.setPixmap(
-                    QPixmap.fromImage(qt_image).scaled(
-                        320, 240, 
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                )
-        
-        if self.is_recording and self.camera_mode == "video" and not self.recording_paused:
-            self.video_writers[cam_id].write(original_frame)
+                # Поток камеры уже подготовил изображение под размер метки
+                started = time.perf_counter_ns()
+                preview_label.setPixmap(QPixmap.fromImage(qt_image))
+                metrics.record(cam_id, "paint", (time.perf_counter_ns() - started) / 1e6)
+
+    def update_encoder_stats(self, cam_id, stats):
+        container = self.preview_containers.get(cam_id)
+        if container is not None:
+            container.setTitle(
+                f"Камера {cam_id} · очередь {stats['queue']} · "
+                f"потеряно {stats['dropped']} · {stats['latency_ms']} мс · "
+                f"{stats['encode_fps']} к/с · {stats['bitrate_kbps']} кбит/с")
+
+    def set_metrics_visible(self, visible):
+        self.show_metrics = visible
+        for label in self.metrics_labels.values():
+            label.setVisible(visible)
+        if visible:
+            self.update_metrics_overlay()
+            self.metrics_timer.start(1000)
+        else:
+            self.metrics_timer.stop()
+
+    def update_metrics_overlay(self):
+        for cam_id, label in self.metrics_labels.items():
+            label.setText(metrics.overlay_text(cam_id))
 
     def finish_recording(self):
+        self.cleanup()
+        self.window.navigate_to(MainPage)
+
+    def stop_recording(self):
+        self.storage_timer.stop()
+        self.window.storage.release(self.session_folder)
         self.is_recording = False
         self.recording_paused = False
-        for writer in self.video_writers.values():
-            writer.release()
-        self.video_writers.clear()
-        self.record_btn.setEnabled(True)
+        # Все кодировщики останавливаются одновременно; файлы закрываются в их потоках
+        for cam_id, encoder in self.encoders.items():
+            self.window.camera_sessions.remove_sink(cam_id, encoder.submit)
+            encoder.stop()
+            self.window.keep_until_finished(encoder)
+            encoder.finished.connect(self.on_encoder_stopped)
+            self.closing_encoders.add(encoder)
+        self.encoders.clear()
+        self.record_btn.setEnabled(not self.closing_encoders)
+        self.profile_combo.setEnabled(True)
         self.pause_btn.setEnabled(False)
         self.finish_btn.setEnabled(False)
-        self.window.navigate_to(MainPage)
+
+    def on_encoder_stopped(self):
+        self.closing_encoders.discard(self.sender())
+        if not self.closing_encoders and not self.is_recording:
+            self.record_btn.setEnabled(True)
 
     def get_worker(self, cam_id):
         """Возвращает worker для указанной камеры"""
-        for worker in self.workers:
-            if worker.camera_id == cam_id:
-                return worker
+        if cam_id in self.subscriptions:
+            return self.window.camera_sessions.worker(cam_id)
         return None
 
+    def select_snapshot_frames(self):
+        """Выбирает по кадру с каждой камеры: (момент снимка, {cam_id: (seq, время захвата)})"""
+        buffers = {}
+        for cam_id in self.camera_ids:
+            worker = self.get_worker(cam_id)
+            if worker and worker.frames.latest_seq() >= 0:
+                buffers[cam_id] = worker.frames
+        if not buffers:
+            return None, {}
+
+        # Номер последнего кадра читается один раз: иначе он может не совпасть с временем
+        latest = {}
+        for cam_id, frames in buffers.items():
+            seq = frames.latest_seq()
+            latest[cam_id] = (seq, frames.timestamp(seq))
+        stamps = [stamp for _, stamp in latest.values() if stamp is not None]
+        if not stamps:
+            return None, {}
+        if not self.sync_capture:
+            trigger = max(stamps)
+            selected = latest
+        else:
+            trigger = min(stamps)
+            selected = {cam_id: frames.closest(trigger) for cam_id, frames in buffers.items()}
+        return trigger, {cam_id: (seq, stamp) for cam_id, (seq, stamp) in selected.items() if stamp is not None}
+
+    def copy_snapshot_frame(self, cam_id, seq, stamp, trigger):
+        """Копия выбранного кадра; если слот уже перезаписан - ближайшего к trigger из оставшихся"""
+        frames = self.get_worker(cam_id).frames
+        for _ in range(2):
+            frame = frames.copy(seq)
+            if frame is not None:
+                return frame, (stamp - trigger) / 1e6
+            seq, stamp = frames.closest(trigger)
+            if stamp is None:
+                break
+        return None, None
+
     def capture_photos(self):
+        sizes = [self.get_worker(cam_id).capture_size() for cam_id in self.camera_ids if self.get_worker(cam_id)]
+        if not self.window.storage.ensure_available(StorageManager.estimate_photo(sizes)):
+            QMessageBox.critical(self, "Нет места", "На диске нет места для снимков. Выгрузите данные на сервер.")
+            return
         try:
             self.count_try += 1
             self.count_try_label_2.setText(str(self.count_try))
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            trigger, selected = self.select_snapshot_frames()
+            out_of_sync = []
+            missing = []
+            shots = {}
             for cam_id in self.camera_ids:
-                worker = self.get_worker(cam_id)
-                if worker and worker.last_frame is not None:
-                    filename = os.path.join(self.session_folder, 
-                                          f"photo_{timestamp}_num_{self.count_try}_cam{cam_id}.jpg")
-                    cv2.imwrite(filename, worker.last_frame)
-                    with open(os.path.join(self.session_folder, f"session_{cam_id}_try_{self.count_try}.json"), 'w') as f:
-                        json.dump({
-                            "greenHouse": self.window.state.location_data['complex'],
-                            "block": self.window.state.location_data['block'],
-                            "gardenBed": self.window.state.location_data['tray'],
-                            "gardenBedSide": self.window.state.location_data['side'],
-                            "gardenBedPoint": self.selected_point,
-                            "fileURL": filename,
-                            "fileType": "photo",
-                            "task": "crowns",
-                            "createDate": timestamp
-                        }, f)
-            
-            QMessageBox.information(self, "Успех", f"Фото сохранены в папку:\n{self.session_folder}")
+                frame = skew_ms = None
+                if cam_id in selected:
+                    frame, skew_ms = self.copy_snapshot_frame(cam_id, *selected[cam_id], trigger)
+                if frame is None:
+                    missing.append(cam_id)
+                else:
+                    shots[cam_id] = (frame, skew_ms)
+            for cam_id, (frame, skew_ms) in shots.items():
+                synced = abs(skew_ms) <= self.sync_tolerance_ms
+                if not synced:
+                    out_of_sync.append(cam_id)
+                filename = os.path.join(self.session_folder, 
+                                      f"photo_{timestamp}_num_{self.count_try}_cam{cam_id}.jpg")
+                task = PhotoSaveTask(frame, filename, {
+                        "greenHouse": self.window.state.location_data['complex'],
+                        "block": self.window.state.location_data['block'],
+                        "gardenBed": self.window.state.location_data['tray'],
+                        "gardenBedSide": self.window.state.location_data['side'],
+                        "gardenBedPoint": self.selected_point,
+                        "fileURL": filename,
+                        "fileType": "photo",
+                        "task": "crowns",
+                        "createDate": timestamp,
+                        "captureSkewMs": round(skew_ms, 2),
+                        "syncToleranceMs": self.sync_tolerance_ms,
+                        "synced": synced,
+                        "missingCameras": missing
+                    }, self.metadata_log, self.window.manifest, cam_id)
+                task.signals.saved.connect(self.on_photo_saved)
+                task.signals.failed.connect(self.on_photo_failed)
+                self.pending_saves += 1
+                self.save_pool.start(task)
+
+            # Мгновенное подтверждение снимка, запись идёт в фоне
+            self.shoot_btn.setStyleSheet("background-color: #f1c40f; color: black;")
+            QTimer.singleShot(150, lambda: self.shoot_btn.setStyleSheet("background-color: #27ae60; color: white;"))
+            # Замечания о последнем снимке остаются в строке статуса и после сохранения
+            self.shot_note = ""
+            if out_of_sync:
+                self.shot_note += f" · рассинхрон камер {out_of_sync}"
+            if missing:
+                self.shot_note += f" · нет кадра с камер {missing}"
+            self.update_save_status()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка при сохранении фото: {str(e)}")
 
+    def on_photo_saved(self, filename):
+        self.pending_saves -= 1
+        self.update_save_status()
+
+    def on_photo_failed(self, filename, error):
+        self.pending_saves -= 1
+        self.update_save_status()
+        QMessageBox.critical(self, "Ошибка", f"Ошибка при сохранении фото {filename}: {error}")
+
+    def update_save_status(self):
+        if self.pending_saves:
+            self.save_status_label.setText(f"Сохранение фото: {self.pending_saves}{self.shot_note}")
+        else:
+            self.save_status_label.setText(f"Фото сохранены ✓ {self.session_folder}{self.shot_note}")
+
     def finish_photo_session(self):
         self.cleanup()
         self.window.navigate_to(MainPage)
@@ -833,50 +2085,1022 @@ class ShootingControlPage(QWidget):
         self.window.navigate_to(MainPage)
 
     def cleanup(self):
-        for worker in self.workers:
-            worker.stop()
+        self.metrics_timer.stop()
+        self.metadata_timer.stop()
+        if self.camera_mode == "video":
+            self.stop_recording()
+        # Потоки камер принадлежат CameraSessionManager: страница только отписывается
+        for cam_id, subscription in self.subscriptions.items():
+            preview_label = self.preview_labels.get(cam_id)
+            if preview_label is not None:
+                CameraSessionManager.disconnect_slot(preview_label.size_changed, subscription.set_size)
+            self.window.camera_sessions.unsubscribe(subscription)
+        self.subscriptions = {}
+        self.save_pool.waitForDone()
+        if self.metadata_log is not None:
+            self.metadata_log.close()
         with QMutexLocker(self.preview_mutex):
             self.preview_labels.clear()
-        
-        if self.camera_mode == "video":
-            self.finish_recording()
+
+class CameraSessionManager(QObject):
+    """Единственный владелец устройств захвата: страницы подписываются на кадры, а не открывают камеры"""
+    def __init__(self, state, parent=None):
+        super().__init__(parent)
+        self.state = state
+        self.workers = {}  # cam_id -> CameraWorker
+
+    def acquire(self, cam_id):
+        """Работающий поток камеры cam_id; запускается при первом обращении"""
+        worker = self.workers.get(cam_id)
+        if worker is None or worker.isFinished():
+            if cam_id == GOPRO_CAMERA_ID:
+                worker = GoProStreamWorker(cam_id, self.state.gopro_stream_url)
+            else:
+                worker = CameraWorker(cam_id, mjpeg_passthrough=self.state.mjpeg_capture)
+            worker.start()
+            self.workers[cam_id] = worker
+        return worker
+
+    def worker(self, cam_id):
+        return self.workers.get(cam_id)
+
+    def subscribe(self, cam_id, slot, size=(320, 240), fps=30):
+        """Подписывает slot(cam_id, QImage, seq) на превью камеры cam_id"""
+        subscription = FrameSubscription(cam_id, size, fps)
+        subscription.frame_ready.connect(slot)
+        # Подключается после slot: превью считается отрисованным, когда slot отработал
+        subscription.frame_ready.connect(subscription.consumed)
+        self.acquire(cam_id).add_subscription(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        worker = self.workers.get(subscription.camera_id)
+        if worker:
+            worker.remove_subscription(subscription)
+        self.disconnect_slot(subscription.frame_ready)
+
+    def add_sink(self, cam_id, sink):
+        """sink(cam_id, seq) вызывается в потоке захвата на каждый кадр"""
+        worker = self.acquire(cam_id)
+        worker.add_sink(sink)
+        return worker
+
+    def remove_sink(self, cam_id, sink):
+        worker = self.workers.get(cam_id)
+        if worker:
+            worker.remove_sink(sink)
+
+    def stop_all(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers.clear()
+
+    @staticmethod
+    def disconnect_slot(signal, slot=None):
+        """Отключает slot (или все слоты), если он подключён"""
+        try:
+            if slot is None:
+                signal.disconnect()
+            else:
+                signal.disconnect(slot)
+        except (RuntimeError, TypeError):
+            pass
+
+
+class PipelineMetrics:
+    """Таймеры стадий и счётчики тракта кадров по камерам"""
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.stages = {}  # (cam_id, стадия) -> [число замеров, сумма мс, скользящее среднее мс, максимум мс]
+        self.counters = {}  # (cam_id, имя) -> значение
+        self.gauges = {}  # (cam_id, имя) -> последнее значение
+
+    def record(self, cam_id, stage, ms):
+        with self.lock:
+            entry = self.stages.get((cam_id, stage))
+            if entry is None:
+                self.stages[(cam_id, stage)] = [1, ms, ms, ms]
+            else:
+                entry[0] += 1
+                entry[1] += ms
+                entry[2] += (ms - entry[2]) * self.smoothing
+                if ms > entry[3]:
+                    entry[3] = ms
+
+    def count(self, cam_id, name, value=1):
+        with self.lock:
+            self.counters[(cam_id, name)] = self.counters.get((cam_id, name), 0) + value
+
+    def gauge(self, cam_id, name, value):
+        self.gauges[(cam_id, name)] = value
+
+    def snapshot(self):
+        """{cam_id: {"stages": {...}, "counters": {...}, "gauges": {...}}} с накопленными значениями"""
+        result = {}
+        with self.lock:
+            for (cam_id, stage), (count, total, avg, peak) in self.stages.items():
+                result.setdefault(cam_id, {"stages": {}, "counters": {}, "gauges": {}})["stages"][stage] = {
+                    "count": count, "total_ms": total, "avg_ms": avg, "max_ms": peak}
+            for (cam_id, name), value in self.counters.items():
+                result.setdefault(cam_id, {"stages": {}, "counters": {}, "gauges": {}})["counters"][name] = value
+            for (cam_id, name), value in list(self.gauges.items()):
+                result.setdefault(cam_id, {"stages": {}, "counters": {}, "gauges": {}})["gauges"][name] = value
+        return result
+
+    def overlay_text(self, cam_id):
+        """Короткая сводка по камере для наложения на превью"""
+        camera = self.snapshot().get(cam_id)
+        if not camera:
+            return "нет данных"
+        gauges = camera["gauges"]
+        parts = [f"{gauges.get('fps', 0):.1f} к/с"]
+        for stage in ("grab", "copy", "resize", "convert", "emit", "paint", "encode", "imwrite"):
+            if stage in camera["stages"]:
+                parts.append(f"{stage} {camera['stages'][stage]['avg_ms']:.1f}")
+        if "queue" in gauges:
+            parts.append(f"очередь {gauges['queue']}")
+        dropped = gauges.get("dropped", 0) + camera["counters"].get("read_failures", 0)
+        parts.append(f"потеряно {dropped}")
+        return " · ".join(parts)
+
+
+metrics = PipelineMetrics()
+
+
+class MetricsLogger(QObject):
+    """Раз в interval секунд дописывает в файл строку JSON с метриками за интервал"""
+    def __init__(self, path, interval=10.0, source=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.source = source or metrics
+        self.previous = {}
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.write)
+        self.timer.start(int(interval * 1000))
+
+    def write(self):
+        current = self.source.snapshot()
+        cameras = {}
+        for cam_id, camera in current.items():
+            before = self.previous.get(cam_id, {"stages": {}, "counters": {}})
+            stages = {}
+            for stage, stats in camera["stages"].items():
+                prev = before["stages"].get(stage, {"count": 0, "total_ms": 0.0})
+                count = stats["count"] - prev["count"]
+                if count:
+                    stages[stage] = {"n": count,
+                                     "avg_ms": round((stats["total_ms"] - prev["total_ms"]) / count, 3),
+                                     "max_ms": round(stats["max_ms"], 3)}
+            counters = {name: value - before["counters"].get(name, 0)
+                        for name, value in camera["counters"].items()}
+            cameras[str(cam_id)] = {"stages": stages, "counters": counters, **camera["gauges"]}
+        self.previous = current
+        line = {"time": datetime.now().isoformat(timespec="seconds"), "host": platform.node(),
+                "cameras": cameras}
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Не удалось записать метрики в {self.path}: {e}")
+
+    def stop(self):
+        self.timer.stop()
+        self.write()
+
+
+class FrameRingBuffer:
+    """Кольцевой буфер кадров камеры с предвыделенными слотами"""
+    def __init__(self, slots=4):
+        self.slots = slots
+        self.frames = [None] * slots
+        self.seqs = [-1] * slots
+        self.stamps = [0] * slots  # time.monotonic_ns() момента захвата
+        self.last_seq = -1
+        self.mutex = QMutex()
+
+    @property
+    def nbytes(self):
+        """Объём памяти, занятый слотами"""
+        return sum(frame.nbytes for frame in self.frames if frame is not None)
+
+    def begin_write(self):
+        """Помечает следующий слот как занятый и возвращает его массив для записи"""
+        with QMutexLocker(self.mutex):
+            index = (self.last_seq + 1) % self.slots
+            self.seqs[index] = -1
+            return self.frames[index]
+
+    def commit(self, frame, timestamp=None):
+        """Публикует записанный кадр и возвращает его номер"""
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        with QMutexLocker(self.mutex):
+            seq = self.last_seq + 1
+            index = seq % self.slots
+            # Если камера вернула новый массив (первый кадр или смена разрешения),
+            # он становится постоянным слотом
+            self.frames[index] = frame
+            self.seqs[index] = seq
+            self.stamps[index] = timestamp
+            self.last_seq = seq
+            return seq
+
+    def latest_seq(self):
+        with QMutexLocker(self.mutex):
+            return self.last_seq
+
+    def timestamp(self, seq):
+        """Время захвата кадра seq или None, если он уже перезаписан"""
+        with QMutexLocker(self.mutex):
+            index = seq % self.slots
+            if seq < 0 or self.seqs[index] != seq:
+                return None
+            return self.stamps[index]
+
+    def closest(self, instant):
+        """Возвращает (seq, время захвата) кадра, ближайшего к моменту instant"""
+        with QMutexLocker(self.mutex):
+            best = (-1, None)
+            for seq, stamp in zip(self.seqs, self.stamps):
+                if seq < 0:
+                    continue
+                if best[1] is None or abs(stamp - instant) < abs(best[1] - instant):
+                    best = (seq, stamp)
+            return best
+
+    def get(self, seq):
+        """Возвращает слот с кадром seq без копирования или None, если он уже перезаписан"""
+        with QMutexLocker(self.mutex):
+            index = seq % self.slots
+            if seq < 0 or self.seqs[index] != seq:
+                return None
+            return self.frames[index]
+
+    def copy(self, seq, out=None):
+        """Копирует кадр seq в out (или в новый массив) и проверяет, что слот не перезаписали"""
+        frame = self.get(seq)
+        if frame is None:
+            return None
+        if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+            out = np.empty_like(frame)
+        np.copyto(out, frame)
+        if self.get(seq) is None:
+            return None
+        return out
+
+
+def preview_image(frame, width, height):
+    """Вписывает кадр BGR в width x height одним resize и оборачивает в QImage без cvtColor"""
+    h, w = frame.shape[:2]
+    scale = min(width / w, height / h)
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    preview = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+    return QImage(preview.data, size[0], size[1], preview.strides[0], QImage.Format.Format_BGR888)
+
+
+# Флаги imdecode, декодирующие JPEG сразу в уменьшенном размере
+REDUCED_DECODE_FLAGS = [  # Имена флагов: cv2 загружается при первом кадре
+    (8, "IMREAD_REDUCED_COLOR_8"),
+    (4, "IMREAD_REDUCED_COLOR_4"),
+    (2, "IMREAD_REDUCED_COLOR_2"),
+]
+
+
+def decode_preview(buffer, frame_size, width, height):
+    """Превью из сжатого кадра MJPEG с уменьшением прямо при декодировании"""
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+        if frame_size[0] / factor >= width and frame_size[1] / factor >= height:
+            flag = getattr(cv2, reduced_flag)
+            break
+    frame = cv2.imdecode(buffer, flag)
+    return preview_image(frame, width, height) if frame is not None else None
+
+
+def preview_fps_for_size(width, height, max_fps=30, min_fps=10):
+    """Частота превью по площади виджета: от 640x480 и больше - max_fps, миниатюры реже"""
+    ratio = width * height / (640 * 480)
+    return max(min_fps, min(max_fps, max_fps * ratio))
+
+
+class PreviewLabel(QLabel):
+    """Метка превью, сообщающая потоку камеры свой видимый размер ((0, 0) - скрыта)"""
+    size_changed = Signal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Размер задаёт раскладка, а не картинка - иначе превью раздувает виджет
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.isVisible():
+            self.size_changed.emit(self.width(), self.height())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.size_changed.emit(self.width(), self.height())
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.size_changed.emit(0, 0)
+
+
+class FrameSubscription(QObject):
+    """Подписка на превью камеры со своими размером и частотой"""
+    frame_ready = Signal(int, QImage, int)  # (cam_id, превью, номер кадра в буфере)
+
+    def __init__(self, camera_id, size=(320, 240), fps=30):
+        super().__init__()
+        self.camera_id = camera_id
+        self.size = size
+        self.fps = fps
+        self.pending = False  # Превью отправлено, но ещё не отрисовано
+        self.last_sent = 0.0
+
+    def set_size(self, width, height):
+        """Размер видимого виджета превью; (0, 0) приостанавливает подписку"""
+        self.size = (width, height)
+
+    def consumed(self, *args):
+        self.pending = False
+
+    def due(self, now):
+        width, height = self.size
+        if not (width and height) or self.pending:
+            return False
+        fps = min(self.fps, preview_fps_for_size(width, height))
+        return now - self.last_sent >= 1.0 / fps
+
 
 class CameraWorker(QThread):
-    frame_ready = Signal(int, QImage, np.ndarray)
-    
-    def __init__(self, camera_id):
+    def __init__(self, camera_id, buffer_slots=4, mjpeg_passthrough=False):
         super().__init__()
         self.camera_id = camera_id
+        # Кадры хранятся сжатыми, как их отдала камера (одномерный буфер JPEG)
+        self.mjpeg_passthrough = mjpeg_passthrough
         self.running = True
-        self.last_frame = None
-        self.mutex = QMutex()
+        self.frames = FrameRingBuffer(buffer_slots)
+        # Кортежи заменяются целиком (копирование при записи): поток захвата читает
+        # их без блокировок, а добавление из интерфейса не ждёт cap.read
+        self.sinks = ()  # Вызываются из потока захвата с (cam_id, seq)
+        self.subscriptions = ()  # FrameSubscription: превью не влияют на частоту захвата
+        self.frame_size = (0, 0)  # Фактическое разрешение захвата (ширина, высота)
+        self.device_fps = 0.0  # Заявленная камерой частота
+        self.measured_fps = 0.0  # Фактическая частота захвата
+        self.last_captured = None
+        self.mutex = QMutex()  # Только для изменения sinks и subscriptions
+
+    def capture_size(self):
+        return self.frame_size if all(self.frame_size) else (1920, 1080)
+
+    def capture_fps(self):
+        # Округление нужно кодекам: MPEG-4 не принимает дробную частоту с большим знаменателем
+        return round(self.measured_fps or self.device_fps or 30.0, 2)
+
+    def add_sink(self, sink):
+        with QMutexLocker(self.mutex):
+            self.sinks = self.sinks + (sink,)
+
+    def remove_sink(self, sink):
+        """После возврата приёмник может получить ещё не более одного кадра"""
+        with QMutexLocker(self.mutex):
+            self.sinks = tuple(item for item in self.sinks if item != sink)
+
+    def add_subscription(self, subscription):
+        with QMutexLocker(self.mutex):
+            self.subscriptions = self.subscriptions + (subscription,)
+
+    def remove_subscription(self, subscription):
+        with QMutexLocker(self.mutex):
+            self.subscriptions = tuple(item for item in self.subscriptions if item is not subscription)
 
     def run(self):
         cap = cv2.VideoCapture(self.camera_id)
+        if self.mjpeg_passthrough:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 3840)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 2160)
-
+        if self.mjpeg_passthrough:
+            # V4L2 отдаёт буфер MJPEG без декодирования; если бэкенд этого не
+            # умеет, приходят обычные кадры BGR и всё работает как раньше
+            cap.set(cv2.CAP_PROP_FORMAT, -1)
+        self.device_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        # Камера может не поддерживать 4K: фактическое разрешение берётся у драйвера
+        self.frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        # Захват идёт с родной частотой камеры: cap.read блокируется до следующего кадра
         while self.running:
-            with QMutexLocker(self.mutex):
+            started = time.perf_counter_ns()
+            ret, frame = cap.read(self.frames.begin_write())
+            captured = time.monotonic_ns()
+            metrics.record(self.camera_id, "grab", (time.perf_counter_ns() - started) / 1e6)
+            if ret:
                 if not self.running:
                     break
-                
-                ret, frame = cap.read()
-                if ret:
-                    self.last_frame = frame.copy()
-                    preview = cv2.resize(frame, (640, 480))
-                    rgb_preview = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_preview.shape
-                    qt_img = QImage(rgb_preview.data, w, h, QImage.Format.Format_RGB888)
-                    self.frame_ready.emit(self.camera_id, qt_img, frame)
-            QThread.msleep(30)
+                self.publish_frame(frame, captured)
+            else:
+                metrics.count(self.camera_id, "read_failures")
+                QThread.msleep(10)
         
         cap.release()
 
+    def publish_frame(self, frame, captured):
+        """Публикует записанный в буфер кадр: приёмники, частота, превью"""
+        seq = self.frames.commit(frame, captured)
+        if frame.ndim == 3:
+            self.frame_size = (frame.shape[1], frame.shape[0])
+        if self.last_captured is not None and captured > self.last_captured:
+            fps = 1e9 / (captured - self.last_captured)
+            self.measured_fps = fps if not self.measured_fps else self.measured_fps * 0.95 + fps * 0.05
+        self.last_captured = captured
+        metrics.count(self.camera_id, "frames")
+        metrics.gauge(self.camera_id, "fps", round(self.measured_fps, 1))
+        started = time.perf_counter_ns()
+        for sink in self.sinks:
+            sink(self.camera_id, seq)
+        emit_ns = time.perf_counter_ns() - started
+        now = time.monotonic()
+        images = {}  # Подписки одного размера получают одно и то же изображение
+        for subscription in self.subscriptions:
+            if not subscription.due(now):
+                continue
+            size = subscription.size
+            if size not in images:
+                started = time.perf_counter_ns()
+                if frame.ndim == 3:
+                    images[size] = preview_image(frame, *size)
+                    stage = "resize"
+                else:
+                    images[size] = decode_preview(frame, self.capture_size(), *size)
+                    stage = "convert"
+                metrics.record(self.camera_id, stage, (time.perf_counter_ns() - started) / 1e6)
+            if images[size] is not None:
+                subscription.last_sent = now
+                subscription.pending = True
+                started = time.perf_counter_ns()
+                subscription.frame_ready.emit(self.camera_id, images[size], seq)
+                emit_ns += time.perf_counter_ns() - started
+        metrics.record(self.camera_id, "emit", emit_ns / 1e6)
+        return seq
+
     def stop(self):
-        with QMutexLocker(self.mutex):
-            self.running = False
+        self.running = False
         self.wait()
+
+
+GOPRO_CAMERA_ID = 100  # Номер источника GoPro среди индексов USB-камер
+
+
+def ts_video_frame_starts(data):
+    """Начала кадров видео (PES) в датаграмме MPEG-TS: [признак точки произвольного доступа]"""
+    starts = []
+    for offset in range(0, len(data) - 187, 188):
+        if data[offset] != 0x47 or not data[offset + 1] & 0x40:
+            continue
+        control = (data[offset + 3] >> 4) & 3
+        payload = offset + 4
+        random_access = False
+        if control & 2:
+            length = data[offset + 4]
+            random_access = length > 0 and bool(data[offset + 5] & 0x40)
+            payload += 1 + length
+        if (control & 1 and payload + 4 <= offset + 188 and data[payload:payload + 3] == b"\0\0\1"
+                and 0xE0 <= data[payload + 3] <= 0xEF):
+            starts.append(random_access)
+    return starts
+
+
+class GoProStreamWorker(CameraWorker):
+    """Приём потока GoPro (MPEG-TS по UDP) с минимальной задержкой"""
+    def __init__(self, camera_id, url="udp://@10.5.5.100:8554", stream_size=(1920, 1080),
+                 buffer_slots=4, max_packets=2048, max_latency_ms=500):
+        super().__init__(camera_id, buffer_slots)
+        self.url = url
+        self.frame_size = stream_size
+        self.packets = queue.Queue(maxsize=max_packets)
+        self.max_latency_ms = max_latency_ms
+        self.sock = None
+        self.decoder = None
+        # Время прихода начала каждого кадра, переданного декодеру, в порядке передачи.
+        # Отсчёт начинается с ключевого кадра: до него декодер ничего не выдаёт
+        self.arrivals_lock = threading.Lock()
+        self.arrivals = deque(maxlen=256)
+        self.arrivals_synced = False
+        self.latency_ms = 0.0  # Сглаженная задержка от прихода начала кадра до его декодирования
+        self.dropped_packets = 0
+        self.late_frames = 0
+
+    def open_socket(self):
+        # udp://@host:port — слушать на адресе host (адрес киоска в сети GoPro)
+        address = urlparse(self.url)
+        host = (address.hostname or "").lstrip("@")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        try:
+            sock.bind((host, address.port or 8554))
+        except OSError:
+            sock.bind(("", address.port or 8554))
+        sock.settimeout(0.5)
+        return sock
+
+    def receive_packets(self):
+        while self.running:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            packet = (time.monotonic_ns(), data)
+            try:
+                self.packets.put_nowait(packet)
+            except queue.Full:
+                try:
+                    self.packets.get_nowait()
+                    self.dropped_packets += 1
+                    metrics.count(self.camera_id, "dropped_packets")
+                except queue.Empty:
+                    pass
+                else:
+                    # Выброшенные кадры декодер не выдаст: счёт кадров сбит до следующего ключевого
+                    with self.arrivals_lock:
+                        self.arrivals.clear()
+                        self.arrivals_synced = False
+                self.packets.put_nowait(packet)
+
+    def feed_decoder(self):
+        while self.running:
+            try:
+                arrived, data = self.packets.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            starts = ts_video_frame_starts(data)
+            if starts:
+                with self.arrivals_lock:
+                    for random_access in starts:
+                        self.arrivals_synced |= random_access
+                        if self.arrivals_synced:
+                            self.arrivals.append(arrived)
+            try:
+                self.decoder.stdin.write(data)
+            except (BrokenPipeError, ValueError, OSError):
+                break
+
+    def read_frame(self, out):
+        view = memoryview(out).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = self.decoder.stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def run(self):
+        width, height = self.frame_size
+        try:
+            self.sock = self.open_socket()
+            self.decoder = subprocess.Popen(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error",
+                 "-fflags", "nobuffer", "-flags", "low_delay",
+                 "-probesize", "65536", "-analyzeduration", "500000",
+                 "-f", "mpegts", "-i", "pipe:0",
+                 "-vf", f"scale={width}:{height}", "-pix_fmt", "bgr24",
+                 "-f", "rawvideo", "pipe:1"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        except OSError as e:
+            print(f"Поток GoPro {self.url} недоступен: {e}")
+            if self.sock:
+                self.sock.close()
+            return
+        readers = [threading.Thread(target=self.receive_packets, daemon=True),
+                   threading.Thread(target=self.feed_decoder, daemon=True)]
+        for thread in readers:
+            thread.start()
+
+        while self.running:
+            slot = self.frames.begin_write()
+            if slot is None or slot.shape != (height, width, 3):
+                slot = np.empty((height, width, 3), dtype=np.uint8)
+            started = time.perf_counter_ns()
+            if not self.read_frame(slot):
+                break
+            metrics.record(self.camera_id, "grab", (time.perf_counter_ns() - started) / 1e6)
+            decoded = time.monotonic_ns()
+            with self.arrivals_lock:
+                if self.arrivals:
+                    arrived = self.arrivals.popleft()
+                else:
+                    # Поток без меток ключевых кадров или сразу после потери пакетов:
+                    # задержка этого кадра неизвестна, счёт начинается со следующего
+                    arrived = None
+                    self.arrivals_synced = True
+            if arrived is None:
+                arrived = decoded
+            else:
+                latency = (decoded - arrived) / 1e6
+                self.latency_ms = latency if not self.latency_ms else self.latency_ms * 0.9 + latency * 0.1
+                metrics.gauge(self.camera_id, "latency_ms", round(self.latency_ms, 1))
+            if (decoded - arrived) / 1e6 > self.max_latency_ms:
+                # Декодер отстал: кадр уже неактуален, слот перезапишется следующим
+                self.late_frames += 1
+                metrics.count(self.camera_id, "late_frames")
+                continue
+            if not self.running:
+                break
+            # Момент съёмки ближе ко времени прихода пакета, чем к концу декодирования
+            self.publish_frame(slot, arrived)
+
+        self.close_stream()
+        for thread in readers:
+            thread.join(timeout=1)
+
+    def close_stream(self):
+        if self.sock:
+            self.sock.close()
+        if self.decoder and self.decoder.poll() is None:
+            self.decoder.kill()
+            self.decoder.wait()
+
+    def stop(self):
+        self.running = False
+        # Разблокирует чтение кадра, если поток с камеры прервался
+        self.close_stream()
+        self.wait()
+
+
+class PhotoSaveSignals(QObject):
+    saved = Signal(str)  # путь к фото
+    failed = Signal(str, str)  # путь к фото, текст ошибки
+
+
+class PhotoSaveTask(QRunnable):
+    """Кодирование JPEG, запись описания в журнал сессии и занесение снимка в журнал выгрузки в пуле потоков"""
+    def __init__(self, frame, filename, metadata, metadata_log=None, manifest=None, camera=None):
+        super().__init__()
+        self.frame = frame
+        self.filename = filename
+        self.metadata = metadata
+        self.metadata_log = metadata_log
+        self.manifest = manifest
+        self.camera = camera
+        self.signals = PhotoSaveSignals()
+
+    def run(self):
+        started = time.perf_counter_ns()
+        try:
+            if self.frame.ndim == 3:
+                ok, encoded = cv2.imencode(".jpg", self.frame)
+                if not ok:
+                    raise IOError("cv2.imencode вернул False")
+                data = encoded.tobytes()
+            else:
+                # Кадр MJPEG с камеры сохраняется байт в байт
+                data = self.frame.tobytes()
+            with open(self.filename, 'wb') as f:
+                f.write(data)
+            if self.metadata_log is not None:
+                self.metadata_log.append(self.metadata)
+            if self.manifest is not None:
+                self.manifest.add_file(self.filename, self.metadata, self.camera,
+                                       len(data), hashlib.sha256(data).hexdigest())
+        except Exception as e:
+            metrics.count(self.camera, "photo_failures")
+            self.signals.failed.emit(self.filename, str(e))
+        else:
+            metrics.record(self.camera, "imwrite", (time.perf_counter_ns() - started) / 1e6)
+            self.signals.saved.emit(self.filename)
+
+
+class RecorderBackend:
+    """Базовый класс записи видеофайла: счётчики кадров, времени кодирования и битрейта"""
+    extension = ".avi"
+    accepts_compressed = False  # Принимает ли write() кадры JPEG без декодирования
+
+    def __init__(self, filename, fps, size):
+        self.filename = filename
+        self.fps = fps
+        self.size = size
+        self.frames = 0
+        self.encode_time = 0.0
+        self.started = time.monotonic()
+        self.open_output()
+
+    def open_output(self):
+        raise NotImplementedError
+
+    def write_frame(self, frame):
+        raise NotImplementedError
+
+    def close_output(self):
+        raise NotImplementedError
+
+    def write(self, frame):
+        started = time.perf_counter()
+        self.write_frame(frame)
+        self.encode_time += time.perf_counter() - started
+        self.frames += 1
+
+    def release(self):
+        self.close_output()
+
+    def stats(self):
+        duration = self.frames / self.fps if self.fps else time.monotonic() - self.started
+        size = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        return {
+            "bitrate_kbps": round(size * 8 / duration / 1000) if duration else 0,
+            "encode_fps": round(self.frames / self.encode_time, 1) if self.encode_time else 0.0,
+        }
+
+
+class OpenCVRecorder(RecorderBackend):
+    """Кодирование средствами OpenCV (по умолчанию XVID в AVI)"""
+    def __init__(self, filename, fps, size, fourcc="XVID"):
+        self.fourcc = fourcc
+        super().__init__(filename, fps, size)
+
+    def open_output(self):
+        self.writer = cv2.VideoWriter(self.filename, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.size)
+
+    def write_frame(self, frame):
+        self.writer.write(frame)
+
+    def close_output(self):
+        self.writer.release()
+
+
+class FfmpegPipeRecorder(RecorderBackend):
+    """Кодирование внешним ffmpeg: кадры BGR подаются в stdin процесса"""
+    extension = ".mp4"
+
+    def __init__(self, filename, fps, size, codec="libx264", preset="veryfast", crf=23):
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        super().__init__(filename, fps, size)
+
+    def input_args(self):
+        return ["-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{self.size[0]}x{self.size[1]}"]
+
+    def output_args(self):
+        args = ["-c:v", self.codec, "-preset", self.preset, "-crf", str(self.crf), "-pix_fmt", "yuv420p",
+                # Фрагментированный MP4 остаётся читаемым, если запись оборвалась
+                "-movflags", "+frag_keyframe+empty_moov"]
+        if self.codec == "libx265":
+            args += ["-x265-params", "log-level=error"]
+        return args
+
+    def open_output(self):
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-y", "-loglevel", "error", *self.input_args(), "-r", str(self.fps), "-i", "-",
+             *self.output_args(), self.filename],
+            stdin=subprocess.PIPE)
+
+    def write_frame(self, frame):
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+
+    def close_output(self):
+        try:
+            self.process.stdin.close()
+        finally:
+            # ffmpeg мог уже завершиться с ошибкой: процесс всё равно нужно дождаться
+            self.process.wait()
+
+
+class MjpegPassthroughRecorder(FfmpegPipeRecorder):
+    """Запись MJPEG без перекодирования: JPEG-кадры камеры упаковываются в AVI как есть"""
+    extension = ".avi"
+    accepts_compressed = True
+
+    def __init__(self, filename, fps, size, quality=90):
+        self.quality = quality
+        self.raw_file = None
+        super().__init__(filename, fps, size)
+
+    def input_args(self):
+        return ["-f", "mjpeg"]
+
+    def output_args(self):
+        return ["-c:v", "copy"]
+
+    def open_output(self):
+        if shutil.which("ffmpeg"):
+            super().open_output()
+        else:
+            self.filename = os.path.splitext(self.filename)[0] + ".mjpeg"
+            self.raw_file = open(self.filename, 'wb')
+
+    def write_frame(self, frame):
+        if frame.ndim == 3:
+            frame = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1]
+        if self.raw_file is not None:
+            self.raw_file.write(frame)
+        else:
+            self.process.stdin.write(memoryview(frame).cast("B"))
+
+    def close_output(self):
+        if self.raw_file is not None:
+            self.raw_file.close()
+        else:
+            super().close_output()
+
+
+# Способы записи видео: название и класс с параметрами
+RECORDER_BACKENDS = {
+    "xvid": ("XVID (OpenCV)", OpenCVRecorder, {}),
+    "mjpeg": ("MJPEG без перекодирования", MjpegPassthroughRecorder, {}),
+    "h264": ("H.264 (ffmpeg)", FfmpegPipeRecorder, {"codec": "libx264"}),
+    "h265": ("H.265 (ffmpeg)", FfmpegPipeRecorder, {"codec": "libx265"}),
+}
+
+
+def create_recorder(backend, path_base, fps, size, **options):
+    """Создаёт запись path_base + расширение выбранного способа"""
+    title, recorder_class, defaults = RECORDER_BACKENDS[backend]
+    if recorder_class is FfmpegPipeRecorder and not shutil.which("ffmpeg"):
+        print(f"ffmpeg не найден, вместо {title} используется XVID")
+        title, recorder_class, defaults = RECORDER_BACKENDS["xvid"]
+        options = {}
+    return recorder_class(path_base + recorder_class.extension, fps, size, **{**defaults, **options})
+
+
+class VideoEncoderThread(QThread):
+    """Поток кодирования видео одной камеры, при необходимости по сегментам"""
+    stats_updated = Signal(int, object)  # (cam_id, статистика)
+    segment_finished = Signal(int, str)  # (cam_id, закрытый файл)
+    failed = Signal(int, str)  # (cam_id, текст ошибки); запись этой камеры остановлена
+
+    def __init__(self, camera_id, frames, recorder, size, max_queue=8, policy="drop",
+                 recorder_factory=None, segment_seconds=0, segment_bytes=0,
+                 on_segment_started=None, on_segment_finished=None, source_size=None):
+        super().__init__()
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Неизвестная политика очереди: {policy}")
+        self.camera_id = camera_id
+        self.frames = frames
+        self.recorder = recorder
+        self.recorder_factory = recorder_factory
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.segment_index = 0
+        self.segment_size = 0  # Размер файла текущего сегмента при последней проверке
+        self.on_segment_started = on_segment_started
+        self.on_segment_finished = on_segment_finished
+        self.segment_open = True
+        self.error = None
+        self.size = size  # (ширина, высота) кадров в файле
+        # Сжатые кадры идут в файл без перекодирования, только если их размер и есть размер файла
+        self.passthrough = recorder.accepts_compressed and source_size in (None, size)
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.running = True
+        self.paused = False
+        self.buffer = None
+        self.written = 0
+        self.dropped = 0
+        self.latency_ms = 0.0
+
+    def submit(self, cam_id, seq):
+        """Ставит кадр в очередь; вызывается из потока захвата"""
+        if self.paused or not self.running:
+            return
+        if self.policy == "block":
+            while self.running:
+                try:
+                    self.queue.put(seq, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+        else:
+            try:
+                self.queue.put_nowait(seq)
+            except queue.Full:
+                self.dropped += 1
+
+    def prepare_frame(self, seq):
+        """Достаёт кадр из кольцевого буфера в размере файла"""
+        source = self.frames.get(seq)
+        if source is None:
+            return None
+        decoded = False
+        if source.ndim != 3:
+            if self.passthrough:
+                return self.frames.copy(seq)
+            # Сжатый кадр для кодека, которому нужен BGR, или для уменьшения по профилю
+            source = cv2.imdecode(source, cv2.IMREAD_COLOR)
+            if source is None or self.frames.get(seq) is None:
+                return None
+            decoded = True
+        if (source.shape[1], source.shape[0]) == self.size:
+            if decoded:
+                return source
+            self.buffer = self.frames.copy(seq, self.buffer)
+            return self.buffer
+        self.buffer = cv2.resize(source, self.size, dst=self.buffer, interpolation=cv2.INTER_AREA)
+        # Слот мог быть перезаписан во время resize
+        return self.buffer if decoded or self.frames.get(seq) is not None else None
+
+    def stats(self):
+        return {
+            "queue": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "latency_ms": round(self.latency_ms, 1),
+            "segment": self.segment_index,
+            **self.recorder.stats(),
+        }
+
+    def segment_due(self):
+        """Пора ли закрыть текущий сегмент"""
+        if self.recorder_factory is None:
+            return False
+        if self.segment_seconds and self.recorder.frames >= self.segment_seconds * self.recorder.fps:
+            return True
+        return bool(self.segment_bytes) and self.segment_size >= self.segment_bytes
+
+    def finish_segment(self):
+        if not self.segment_open:
+            return
+        self.segment_open = False
+        try:
+            self.recorder.release()
+        except (OSError, ValueError) as e:
+            self.error = self.error or f"Ошибка закрытия {self.recorder.filename}: {e}"
+        # Даже неудачно закрытый файл уходит в очередь выгрузки: в нём то, что успели записать
+        if self.on_segment_finished:
+            self.on_segment_finished(self.camera_id, self.recorder.filename)
+        self.segment_finished.emit(self.camera_id, self.recorder.filename)
+
+    def next_segment(self):
+        """Закрывает текущий файл и продолжает запись в следующий"""
+        self.finish_segment()
+        self.segment_index += 1
+        self.segment_size = 0
+        self.recorder = self.recorder_factory(self.segment_index)
+        self.segment_open = True
+        if self.on_segment_started:
+            self.on_segment_started(self.camera_id, self.recorder.filename, self.segment_index)
+
+    def run(self):
+        last_report = time.monotonic()
+        while True:
+            try:
+                seq = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                seq = None
+            if seq is None:
+                # Таймаут или None от stop()
+                if not self.running:
+                    break
+            else:
+                started = time.perf_counter()
+                frame = self.prepare_frame(seq)
+                metrics.record(self.camera_id, "copy", (time.perf_counter() - started) * 1000)
+                if frame is None:
+                    # Слот перезаписан раньше, чем до него дошла очередь
+                    self.dropped += 1
+                else:
+                    started = time.perf_counter()
+                    try:
+                        self.recorder.write(frame)
+                        if self.segment_due():
+                            self.next_segment()
+                    except (OSError, ValueError) as e:
+                        # Например, ffmpeg завершился из-за недоступного кодека
+                        self.error = f"Ошибка записи {self.recorder.filename}: {e}"
+                        self.running = False
+                        break
+                    elapsed = (time.perf_counter() - started) * 1000
+                    metrics.record(self.camera_id, "encode", elapsed)
+                    # Скользящее среднее времени кодирования кадра
+                    self.latency_ms = elapsed if not self.written else self.latency_ms * 0.9 + elapsed * 0.1
+                    self.written += 1
+                if not self.running and self.queue.empty():
+                    break
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                last_report = now
+                if self.segment_bytes and os.path.exists(self.recorder.filename):
+                    self.segment_size = os.path.getsize(self.recorder.filename)
+                stats = self.stats()
+                metrics.gauge(self.camera_id, "queue", stats["queue"])
+                metrics.gauge(self.camera_id, "dropped", stats["dropped"])
+                self.stats_updated.emit(self.camera_id, stats)
+        self.finish_segment()
+        self.stats_updated.emit(self.camera_id, self.stats())
+        if self.error:
+            self.failed.emit(self.camera_id, self.error)
+
+    def stop(self):
+        """Просит дописать очередь и закрыть файл, не дожидаясь этого (сигнал finished)"""
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # Поток занят и проверит running после текущего кадра
         
         
 if __name__ == '__main__':
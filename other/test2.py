@@ -1,7 +1,7 @@
 import sys
 import cv2
 import numpy as np
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, QThread, QRunnable, QThreadPool, QMutex, QMutexLocker, pyqtSignal
 from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QWidget
 import time
@@ -13,6 +13,17 @@ class VideoThread(QThread):
         super().__init__()
         self.stream_url = stream_url
         self.running = True
+        # Последний декодированный кадр для снимков без переоткрытия потока
+        self.latest = None
+        self.latest_time = 0.0
+        self.mutex = QMutex()
+
+    def latest_frame(self):
+        """Последний кадр в исходном разрешении и время его получения"""
+        # cap.read каждый раз отдаёт новый массив, поэтому кадр не копируется:
+        # поток захвата его больше не меняет
+        with QMutexLocker(self.mutex):
+            return self.latest, self.latest_time
 
     def run(self):
         cap = cv2.VideoCapture(self.stream_url)
@@ -21,6 +32,9 @@ class VideoThread(QThread):
         while self.running:
             ret, frame = cap.read()
             if ret:
+                with QMutexLocker(self.mutex):
+                    self.latest = frame
+                    self.latest_time = time.time()
                 self.frame_ready.emit(frame)
             else:
                 print("Ошибка получения кадра")
@@ -30,6 +44,18 @@ class VideoThread(QThread):
     def stop(self):
         self.running = False
 
+class SnapshotTask(QRunnable):
+    """Кодирование и запись JPEG вне потока интерфейса"""
+    def __init__(self, frame, filename):
+        super().__init__()
+        self.frame = frame
+        self.filename = filename
+
+    def run(self):
+        if not cv2.imwrite(self.filename, self.frame):
+            print(f"Не удалось сохранить {self.filename}")
+
+
 class GoPro4KApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -61,6 +87,7 @@ class GoPro4KApp(QMainWindow):
         self.video_thread = VideoThread(self.stream_url)
         self.video_thread.frame_ready.connect(self.update_frame)
         self.video_thread.start()
+        self.snapshot_pool = QThreadPool(self)
 
         # Переменные записи
         self.recording = False
@@ -100,15 +127,17 @@ class GoPro4KApp(QMainWindow):
             self.record_btn.setText("Начать запись")
 
     def take_snapshot(self):
-        # Получаем последний кадр из потока (в 4K)
-        self.video_thread.frame_ready.disconnect()
-        ret, frame = cv2.VideoCapture(self.stream_url).read()
-        if ret:
-            cv2.imwrite(f"4k_photo_{time.strftime('%Y%m%d_%H%M%S')}.jpg", frame)
-        self.video_thread.frame_ready.connect(self.update_frame)
+        # Последний кадр работающего потока (в 4K): превью и запись не прерываются
+        frame, received = self.video_thread.latest_frame()
+        if frame is None:
+            print("Нет кадров от GoPro")
+            return
+        filename = f"4k_photo_{time.strftime('%Y%m%d_%H%M%S', time.localtime(received))}.jpg"
+        self.snapshot_pool.start(SnapshotTask(frame, filename))
 
     def closeEvent(self, event):
         self.video_thread.stop()
+        self.snapshot_pool.waitForDone()
         if self.video_writer is not None:
             self.video_writer.release()
         event.accept()
@@ -1,7 +1,11 @@
 import sys
+import queue
+import threading
 import cv2
 import requests
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PyQt6.QtCore import Qt, QThread, QObject, pyqtSignal, QTimer
 from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, 
                             QPushButton, QLineEdit, QVBoxLayout, QHBoxLayout,
@@ -35,12 +39,97 @@ class VideoStreamThread(QThread):
     def stop(self):
         self.running = False
 
+class GoProControlClient(QObject):
+    """Управление GoPro по HTTP без блокировки интерфейса.
+
+    Команды ставятся в очередь и по порядку отправляются рабочим потоком через
+    одно постоянное соединение (keep-alive) с таймаутами и повтором при ошибке
+    соединения. Результаты и статус камеры приходят сигналами.
+    """
+    command_finished = pyqtSignal(str, bool, str)  # имя команды, успех, текст ошибки
+    status_updated = pyqtSignal(dict)  # словарь status из /gp/gpControl/status
+    reachable_changed = pyqtSignal(bool)
+
+    def __init__(self, host="10.5.5.9", timeout=(1.0, 3.0), poll_interval=2000):
+        super().__init__()
+        self.base_url = f"http://{host}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Повтор только при сбое соединения: команда затвора не должна сработать дважды
+        retry = Retry(total=2, connect=2, read=0, backoff_factor=0.2)
+        self.session.mount("http://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=1))
+        self.commands = queue.Queue()
+        self.reachable = None
+        self.worker = threading.Thread(target=self.process_commands, daemon=True)
+        self.worker.start()
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll_status)
+        self.poll_interval = poll_interval
+
+    def command(self, name, path, delay=0.0):
+        """Ставит команду в очередь; с delay — через delay секунд, не блокируя интерфейс"""
+        if delay:
+            timer = threading.Timer(delay, self.commands.put, args=((name, path),))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.commands.put((name, path))
+
+    def shutter(self, on, name=None, delay=0.0):
+        self.command(name or ("shutter_on" if on else "shutter_off"),
+                     f"/gp/gpControl/command/shutter?p={1 if on else 0}", delay)
+
+    def start_polling(self):
+        self.poll_status()
+        self.poll_timer.start(self.poll_interval)
+
+    def stop_polling(self):
+        self.poll_timer.stop()
+
+    def poll_status(self):
+        # Опрос статуса не копится за командами, если камера отвечает медленно
+        if self.commands.empty():
+            self.commands.put(("status", "/gp/gpControl/status"))
+
+    def set_reachable(self, reachable):
+        if reachable != self.reachable:
+            self.reachable = reachable
+            self.reachable_changed.emit(reachable)
+
+    def process_commands(self):
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            name, path = item
+            try:
+                response = self.session.get(self.base_url + path, timeout=self.timeout)
+                response.raise_for_status()
+                self.set_reachable(True)
+                if name == "status":
+                    self.status_updated.emit(response.json().get("status", {}))
+                else:
+                    self.command_finished.emit(name, True, "")
+            except (requests.RequestException, ValueError) as e:
+                if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    self.set_reachable(False)
+                if name != "status":
+                    self.command_finished.emit(name, False, str(e))
+
+    def close(self):
+        self.poll_timer.stop()
+        self.commands.put(None)
+        self.worker.join(timeout=self.timeout[0] + self.timeout[1])
+        self.session.close()
+
+
 class GoProController(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("GoPro Network Controller")
         self.setGeometry(100, 100, 1280, 720)
         self.stream_thread = None
+        self.gopro = GoProControlClient()
         self.setup_ui()
         self.setup_connections()
 
@@ -83,6 +172,8 @@ class GoProController(QMainWindow):
         self.connect_btn.clicked.connect(self.toggle_connection)
         self.record_btn.clicked.connect(self.toggle_recording)
         self.snapshot_btn.clicked.connect(self.take_snapshot)
+        self.gopro.command_finished.connect(self.handle_command_result)
+        self.gopro.status_updated.connect(self.handle_camera_status)
 
     def toggle_connection(self):
         if self.stream_thread and self.stream_thread.isRunning():
@@ -100,6 +191,7 @@ class GoProController(QMainWindow):
         self.stream_thread.new_frame.connect(self.update_video)
         self.stream_thread.connection_status.connect(self.handle_connection_status)
         self.stream_thread.start()
+        self.gopro.start_polling()
 
         self.connect_btn.setText("Отключиться")
         self.url_input.setEnabled(False)
@@ -109,6 +201,7 @@ class GoProController(QMainWindow):
             self.stream_thread.stop()
             self.stream_thread.quit()
             self.stream_thread.wait()
+        self.gopro.stop_polling()
         
         self.connect_btn.setText("Подключиться")
         self.url_input.setEnabled(True)
@@ -137,34 +230,49 @@ class GoProController(QMainWindow):
         except Exception as e:
             print(f"Ошибка обработки кадра: {e}")
 
+    def set_recording_button(self, recording):
+        if recording:
+            self.record_btn.setText("Остановить запись")
+            self.record_btn.setStyleSheet("background-color: #44ff44; color: black;")
+        else:
+            self.record_btn.setText("Начать запись")
+            self.record_btn.setStyleSheet("background-color: #ff4444; color: white;")
+
     def toggle_recording(self):
-        # Реализация управления записью через HTTP-API
-        try:
-            if self.record_btn.text() == "Начать запись":
-                response = requests.get("http://10.5.5.9/gp/gpControl/command/shutter?p=1")
-                if response.status_code == 200:
-                    self.record_btn.setText("Остановить запись")
-                    self.record_btn.setStyleSheet("background-color: #44ff44; color: black;")
-            else:
-                response = requests.get("http://10.5.5.9/gp/gpControl/command/shutter?p=0")
-                if response.status_code == 200:
-                    self.record_btn.setText("Начать запись")
-                    self.record_btn.setStyleSheet("background-color: #ff4444; color: white;")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось управлять записью: {str(e)}")
+        # Реализация управления записью через HTTP-API; ответ придёт в handle_command_result
+        self.record_btn.setEnabled(False)
+        if self.record_btn.text() == "Начать запись":
+            self.gopro.shutter(True, "record_start")
+        else:
+            self.gopro.shutter(False, "record_stop")
 
     def take_snapshot(self):
         if self.stream_thread and self.stream_thread.isRunning():
-            try:
-                response = requests.get("http://10.5.5.9/gp/gpControl/command/shutter?p=1")
-                if response.status_code == 200:
-                    QTimer.singleShot(500, lambda: requests.get("http://10.5.5.9/gp/gpControl/command/shutter?p=0"))
-                    QMessageBox.information(self, "Фото", "Снимок сделан!")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сделать фото: {str(e)}")
+            # Обе команды идут по очереди через одно соединение, интерфейс не ждёт
+            self.gopro.shutter(True, "snapshot")
+            self.gopro.shutter(False, "snapshot_release", delay=0.5)
+
+    def handle_command_result(self, name, ok, error):
+        if name in ("record_start", "record_stop"):
+            self.record_btn.setEnabled(True)
+            if ok:
+                self.set_recording_button(name == "record_start")
+            else:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось управлять записью: {error}")
+        elif name == "snapshot":
+            if ok:
+                QMessageBox.information(self, "Фото", "Снимок сделан!")
+            else:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось сделать фото: {error}")
+
+    def handle_camera_status(self, status):
+        # Статус 10 — идёт кодирование (запись); кнопка следует за камерой
+        if "10" in status and self.record_btn.isEnabled():
+            self.set_recording_button(bool(status["10"]))
 
     def closeEvent(self, event):
         self.disconnect_camera()
+        self.gopro.close()
         event.accept()
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+import sys
+import time
+import socket
+
+# Воспроизведение записанного потока GoPro (MPEG-TS) по UDP для проверки
+# GoProStreamWorker из main.py без камеры.
+# Запуск: python other/udp_replay.py recording.ts 127.0.0.1 8554 [битрейт Мбит/с]
+# затем AMS_GOPRO_STREAM=udp://@127.0.0.1:8554 python main.py
+
+PACKET_SIZE = 188 * 7  # Семь TS-пакетов в датаграмме, как у GoPro
+
+
+def replay(path, host, port, bitrate_mbps=8.0, loop=True):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = PACKET_SIZE * 8 / (bitrate_mbps * 1e6)
+    sent = 0
+    started = time.monotonic()
+    while True:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(PACKET_SIZE)
+                if not data:
+                    break
+                sock.sendto(data, (host, port))
+                sent += 1
+                # Равномерная отправка с заданным битрейтом, без накопления ошибки
+                delay = started + sent * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        if not loop:
+            break
+    sock.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Использование: python other/udp_replay.py файл.ts [хост] [порт] [Мбит/с]")
+        sys.exit(1)
+    host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8554
+    bitrate = float(sys.argv[4]) if len(sys.argv) > 4 else 8.0
+    print(f"Отправка {sys.argv[1]} на udp://{host}:{port}, {bitrate} Мбит/с")
+    try:
+        replay(sys.argv[1], host, port, bitrate)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,107 @@
+import sys
+import os
+import json
+import hashlib
+import threading
+from email import message_from_bytes
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Локальная замена сервера выгрузки для проверки SessionUploader из main.py.
+# Запуск: python other/upload_server.py 8000 uploads
+# затем AMS_UPLOAD_URL=http://127.0.0.1:8000 python main.py
+#
+# Протокол выгрузки с докачкой:
+#   POST /uploads       JSON {fileName, size, metadata} -> {id, offset}
+#   HEAD /uploads/{id}  заголовок Upload-Offset - число принятых байт
+#   POST /uploads/{id}  multipart-поле chunk и Content-Range -> {offset}
+# Клиент хранит id и подтверждённое смещение в журнале сессий и после
+# обрыва связи или перезапуска продолжает с последнего принятого байта.
+
+STORAGE = "uploads"
+lock = threading.Lock()
+uploads = {}  # id -> {"fileName", "size", "metadata"}
+
+
+def data_path(upload_id):
+    return os.path.join(STORAGE, upload_id + ".part")
+
+
+def current_offset(upload_id):
+    if uploads.get(upload_id, {}).get("complete"):
+        return uploads[upload_id]["size"]
+    path = data_path(upload_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    def send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def upload_id(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "uploads":
+            return parts[1]
+        return None
+
+    def do_HEAD(self):
+        upload_id = self.upload_id()
+        if upload_id not in uploads:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Upload-Offset", str(current_offset(upload_id)))
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/uploads":
+            info = json.loads(self.read_body())
+            # Повторное создание того же файла возвращает уже принятое смещение
+            upload_id = hashlib.sha1(f"{info['fileName']}:{info['size']}:{info.get('checksum')}".encode()).hexdigest()
+            with lock:
+                info["complete"] = uploads.get(upload_id, {}).get("complete", False)
+                uploads[upload_id] = info
+                with open(os.path.join(STORAGE, upload_id + ".json"), "w") as f:
+                    json.dump(info, f)
+            self.send_json(201, {"id": upload_id, "offset": current_offset(upload_id)})
+            return
+
+        upload_id = self.upload_id()
+        if upload_id not in uploads:
+            self.send_json(404, {"error": "unknown upload"})
+            return
+        start = int(self.headers["Content-Range"].split()[1].split("-")[0])
+        message = message_from_bytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.read_body(), policy=HTTP)
+        chunk = next(part.get_payload(decode=True) for part in message.iter_parts()
+                     if part.get_param("name", header="content-disposition") == "chunk")
+        with lock:
+            offset = current_offset(upload_id)
+            if start != offset:
+                self.send_json(409, {"offset": offset})
+                return
+            with open(data_path(upload_id), "ab") as f:
+                f.write(chunk)
+            offset += len(chunk)
+            if offset >= uploads[upload_id]["size"]:
+                os.replace(data_path(upload_id), os.path.join(STORAGE, uploads[upload_id]["fileName"]))
+                uploads[upload_id]["complete"] = True
+        self.send_json(200, {"offset": offset})
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    STORAGE = sys.argv[2] if len(sys.argv) > 2 else STORAGE
+    os.makedirs(STORAGE, exist_ok=True)
+    server = ThreadingHTTPServer(("127.0.0.1", port), UploadHandler)
+    print(f"Сервер выгрузки: http://127.0.0.1:{port}, файлы в {STORAGE}")
+    server.serve_forever()